@@ -0,0 +1,81 @@
+"""
+Compares ways of copying a large repository, as done by modify_git_repo.
+
+    PYTHONPATH=$(pwd) python3 benchmarks/bench_clone.py [--files 20000] [--size 4096] [--commits 5] [--dir /scratch]
+
+A synthetic repository with random (incompressible) files is created in --dir, which should be on the filesystem of
+the concourse volumes to be meaningful (reflinks are used on btrfs/xfs only). `git worktree` and `git clone --shared`
+are measured for reference only: they refer to the source by absolute path, which doesn't exist in a put container.
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from pipeline_dsl.utils.modify_git_repo import copy_git_repo
+
+
+def git(*args, cwd):
+    subprocess.run(["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com", "-c", "gc.auto=0"] + list(args), cwd=cwd, stdout=subprocess.DEVNULL, check=True)
+
+
+def create_repo(path, files, size, commits):
+    os.makedirs(path)
+    git("init", "-q", cwd=path)
+    for commit in range(commits):
+        for i in range(files):
+            directory = os.path.join(path, f"dir-{i % 100}")
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"file-{i}"), "wb") as f:
+                f.write(os.urandom(size if commit == 0 else size // 10))
+        git("add", "-A", cwd=path)
+        git("commit", "-q", "-m", f"commit {commit}", cwd=path)
+    # a repository fetched by the git resource is packed
+    git("gc", "-q", cwd=path)
+
+
+def du(*paths):
+    # hard linked files are counted once per invocation
+    return int(subprocess.check_output(["du", "-skc"] + list(paths)).split()[-2]) * 1024
+
+
+def measure(name, fn, source, target, repeat):
+    durations = []
+    for _ in range(repeat):
+        subprocess.run(["rm", "-rf", target], check=True)
+        git("worktree", "prune", cwd=source)
+        # writing back the previous copy must not be accounted to the next one
+        subprocess.run(["sync"], check=True)
+        start = time.perf_counter()
+        fn(source, target)
+        subprocess.run(["sync"], check=True)
+        durations.append(time.perf_counter() - start)
+    written = du(source, target) - du(source)
+    print(f"{name:<14} {min(durations) * 1000:>10.0f}ms {written / 1024 / 1024:>10.0f}MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="repository copy benchmark")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--commits", type=int, default=5)
+    parser.add_argument("--dir", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        source = os.path.join(tmp, "source")
+        target = os.path.join(tmp, "target")
+        create_repo(source, args.files, args.size, args.commits)
+        print(f"repository: {du(source) / 1024 / 1024:.0f}MiB, .git: {du(os.path.join(source, '.git')) / 1024 / 1024:.0f}MiB")
+        print(f"{'variant':<14} {'time':>12} {'written':>13}")
+        measure("copy", lambda s, t: copy_git_repo(s, t, fast=False), source, target, args.repeat)
+        measure("hardlink", copy_git_repo, source, target, args.repeat)
+        measure("clone-shared", lambda s, t: git("clone", "-q", "--shared", s, t, cwd=tmp), source, target, args.repeat)
+        measure("worktree", lambda s, t: git("worktree", "add", "-q", "--detach", t, cwd=s), source, target, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares the init bundle codecs on a real init_dirs tree.
+
+    PYTHONPATH=$(pwd) python3 benchmarks/bench_codecs.py [--starter examples] [--dir key=path ...]
+
+Unpacking runs the same extraction command, which is emitted into the init step of every job.
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from pipeline_dsl.concourse.bundle import CODECS, build, zstd_available
+from pipeline_dsl.concourse.task import STARTER_DIR, PYTHON_DIR
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def measure(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="init bundle codec benchmark")
+    parser.add_argument("--starter", default=os.path.join(ROOT, "examples"), help="directory of the pipeline script")
+    parser.add_argument("--dir", action="append", default=[], help="additional script dir as key=path")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    init_dirs = {
+        STARTER_DIR: os.path.abspath(args.starter),
+        f"{PYTHON_DIR}/pipeline_dsl": os.path.join(ROOT, "pipeline_dsl"),
+    }
+    for entry in args.dir:
+        key, path = entry.split("=", 1)
+        init_dirs[key] = os.path.abspath(path)
+
+    print(f"{'codec':<6} {'size':>10} {'pack':>10} {'unpack':>10}")
+    for name, codec in CODECS.items():
+        if name == "zstd" and not zstd_available():
+            print(f"{name:<6} {'n/a':>10}")
+            continue
+        pack, data = measure(lambda: build(init_dirs, codec), args.repeat)
+
+        def unpack():
+            with tempfile.TemporaryDirectory() as tmp:
+                subprocess.run(["bash", "-c", codec.extract_cmd(tmp)], input=data, stdout=subprocess.DEVNULL, check=True)
+
+        unpack_time, _ = measure(unpack, args.repeat)
+        print(f"{name:<6} {len(data):>10} {pack * 1000:>8.1f}ms {unpack_time * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares dumping a large pipeline as a whole document (NoTagDumper) with the streaming emitter and the compact output using anchors.
+
+    PYTHONPATH=$(pwd) python3 benchmarks/bench_dump.py [--jobs 120] [--tasks 10]
+
+Peak memory is measured with tracemalloc, i.e. allocations done by libyaml itself are not included.
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+from pipeline_dsl import Pipeline, GitRepo
+from pipeline_dsl.utils.dumper import NoTagDumper, BaseDumper
+
+
+def create_pipeline(jobs, tasks):
+    pipeline = Pipeline("benchmark")
+    pipeline.resource("repo", GitRepo("https://example.com/repo.git"))
+    for i in range(jobs):
+        job = pipeline.job(f"job-{i}", groups=[f"group-{i % 5}"])
+        job.get("repo", trigger=True)
+        for t in range(tasks):
+
+            def task():
+                pass
+
+            job.task(name=f"task-{t}", secrets={"token": "TOKEN"}, outputs=["out"])(task)
+    # warm up the bundle cache, so both variants measure dumping only
+    pipeline.bundle_cache.bundle(pipeline.init_dirs).encoded()
+    return pipeline
+
+
+def measure(name, fn):
+    with tempfile.TemporaryFile("w") as f:
+        start = time.perf_counter()
+        fn(f)
+        duration = time.perf_counter() - start
+        size = f.tell()
+    # tracing slows down allocations considerably, therefore memory is measured in a separate run
+    with tempfile.TemporaryFile("w") as f:
+        tracemalloc.start()
+        fn(f)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{name:<10} {duration * 1000:>10.1f}ms {peak / 1024 / 1024:>10.1f}MiB {size / 1024 / 1024:>10.1f}MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pipeline dump benchmark")
+    parser.add_argument("--jobs", type=int, default=120)
+    parser.add_argument("--tasks", type=int, default=10)
+    args = parser.parse_args()
+
+    pipeline = create_pipeline(args.jobs, args.tasks)
+    print(f"emitter: {BaseDumper.__name__}")
+    print(f"{'variant':<10} {'time':>12} {'peak':>13} {'size':>13}")
+    measure("document", lambda f: yaml.dump(pipeline.concourse(), f, allow_unicode=True, Dumper=NoTagDumper))
+    measure("streaming", pipeline.dump)
+    measure("compact", lambda f: pipeline.dump(f, compact=True))
+
+
+if __name__ == "__main__":
+    main()
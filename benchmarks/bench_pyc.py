@@ -0,0 +1,87 @@
+"""
+Measures the import time of a task with and without precompiled bytecode in the init bundle.
+
+    PYTHONPATH=$(pwd) python3 benchmarks/bench_pyc.py [--modules 200] [--functions 20]
+
+A pipeline with many generated helper modules is bundled with and without `precompile`, unpacked like in the
+init step and every helper plus pipeline_dsl is imported by a fresh interpreter, like a task does in a new container.
+`-B` keeps the interpreter from writing `__pycache__`, so every run starts as cold as a concourse task.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pipeline_dsl.concourse.bundle import CODECS, build
+from pipeline_dsl.concourse.task import PYTHON_DIR
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+FUNCTION = """
+def function_{i}(items, prefix="{i}"):
+    result = []
+    for item in items:
+        if isinstance(item, dict):
+            result.append({{k: f"{{prefix}}-{{v}}" for k, v in item.items()}})
+        elif item and str(item).startswith(prefix):
+            result.append(item.upper() if isinstance(item, str) else item)
+    return sorted(result, key=str)
+"""
+
+
+def create_helpers(directory, modules, functions):
+    package = os.path.join(directory, "helpers")
+    os.makedirs(package)
+    open(os.path.join(package, "__init__.py"), "w").close()
+    for m in range(modules):
+        with open(os.path.join(package, f"module_{m}.py"), "w") as f:
+            f.write("".join(FUNCTION.format(i=i) for i in range(functions)))
+    return directory
+
+
+def unpack(data, target):
+    subprocess.run(["bash", "-c", CODECS["bz2"].extract_cmd(target)], input=data, stdout=subprocess.DEVNULL, check=True)
+
+
+def import_time(target, modules, repeat):
+    pythonpath = os.path.join(target, PYTHON_DIR)
+    code = "import pipeline_dsl\n" + "".join(f"import helpers.module_{m}\n" for m in range(modules))
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-B", "-c", code], env={**os.environ, "PYTHONPATH": pythonpath}, check=True)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="precompiled bundle benchmark")
+    parser.add_argument("--modules", type=int, default=200)
+    parser.add_argument("--functions", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    version = "%d.%d" % sys.version_info[:2]
+    with tempfile.TemporaryDirectory() as tmp:
+        helpers = create_helpers(os.path.join(tmp, "helpers"), args.modules, args.functions)
+        init_dirs = {
+            f"{PYTHON_DIR}/pipeline_dsl": os.path.join(ROOT, "pipeline_dsl"),
+            PYTHON_DIR: helpers,
+        }
+        print(f"python {version}, {args.modules} helper modules")
+        print(f"{'variant':<12} {'bundle':>10} {'import':>10}")
+        for name, precompile in [("sources", None), ("precompiled", version)]:
+            data = build(init_dirs, CODECS["bz2"], precompile)
+            target = os.path.join(tmp, name)
+            os.makedirs(target)
+            unpack(data, target)
+            duration = import_time(target, args.modules, args.repeat)
+            print(f"{name:<12} {len(data) / 1024:>8.0f}KiB {duration * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares the codecs for task results on large synthetic results.
+
+    PYTHONPATH=$(pwd) python3 benchmarks/bench_results.py [--items 100000] [--repeat 5]
+
+A result is written like by a task and loaded like by `fn_cached` of a subsequent task. msgpack is only measured if
+the msgpack module is installed.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from pipeline_dsl.concourse.results import RESULT_CODECS, msgpack_available
+
+
+def file_list(items):
+    return [f"src/pkg-{i % 500}/module-{i % 37}/file-{i}.go" for i in range(items)]
+
+
+def manifest(items):
+    return [
+        {"name": f"image-{i}", "tag": f"v1.{i % 100}.{i % 7}", "digest": "sha256:" + "%064x" % random.getrandbits(256), "size": random.randint(1, 1 << 30), "layers": i % 12} for i in range(items // 4)
+    ]
+
+
+def dependency_graph(items):
+    nodes = [f"module-{i}" for i in range(items // 10)]
+    return dict((node, random.sample(nodes, 8)) for node in nodes)
+
+
+def measure(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="task result codec benchmark")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = {
+        "file list": file_list(args.items),
+        "manifest": manifest(args.items),
+        "dependency graph": dependency_graph(args.items),
+    }
+    codecs = [codec for name, codec in RESULT_CODECS.items() if name != "msgpack" or msgpack_available()]
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'result':<18} {'codec':<8} {'size':>10} {'dump':>10} {'load':>10}")
+        for name, result in results.items():
+            for codec in codecs:
+                path = os.path.join(tmp, "result" + codec.extension)
+                dump = measure(lambda: codec.dump(result, path), args.repeat)
+                load = measure(lambda: codec.load(path), args.repeat)
+                size = os.path.getsize(path)
+                print(f"{name:<18} {codec.name:<8} {size / 1024:>7.0f}KiB {dump * 1000:>8.1f}ms {load * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
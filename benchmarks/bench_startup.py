@@ -0,0 +1,78 @@
+"""
+Measures time-to-first-task, i.e. the startup of a single task inside concourse:
+
+    PYTHONPATH=$(pwd) python3 benchmarks/bench_startup.py [--jobs 50] [--tasks 10] [--repeat 20]
+
+The generated pipeline is executed as `python3 pipeline.py --job job-0 --task task-0 --concourse`.
+Pass `--pythonpath <checkout>` to compare against another version of pipeline_dsl.
+Results include compiling pipeline_dsl, unless its bytecode is cached (see PYTHONDONTWRITEBYTECODE).
+"""
+
+import argparse
+import inspect
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PIPELINE = """
+from pipeline_dsl import Pipeline, GitRepo
+
+with Pipeline("startup") as pipeline:
+    pipeline.resource("repo", GitRepo("https://example.com/repo.git"))
+    for i in range({jobs}):
+        with pipeline.job(f"job-{{i}}") as job:
+            job.get("repo")
+            for t in range({tasks}):
+
+                def task(token, out):
+                    return t
+
+                job.task(name=f"task-{{t}}", secrets={{"token": "TOKEN"}}, outputs=["out"])(task)
+"""
+
+
+def caller_discovery(repeat=1000):
+    def with_inspect():
+        frame = inspect.stack()[1]
+        return inspect.getmodule(frame[0]).__file__
+
+    def with_getframe():
+        return sys._getframe(1).f_globals.get("__file__")
+
+    for fn in [with_inspect, with_getframe]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        print(f"{fn.__name__:<14} {(time.perf_counter() - start) / repeat * 1000000:>10.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="task startup benchmark")
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pythonpath", default=ROOT)
+    args = parser.parse_args()
+
+    caller_discovery()
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, "pipeline.py")
+        with open(script, "w") as f:
+            f.write(PIPELINE.format(jobs=args.jobs, tasks=args.tasks))
+        env = dict(os.environ, PYTHONPATH=os.path.abspath(args.pythonpath), TOKEN="token")
+        cmd = [sys.executable, script, "--job", "job-0", "--task", "task-0", "--concourse"]
+        durations = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run(cmd, cwd=tmp, env=env, stdout=subprocess.DEVNULL, check=True)
+            durations.append(time.perf_counter() - start)
+    print(f"time-to-first-task median {statistics.median(durations) * 1000:.1f}ms min {min(durations) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,3 @@
-from pipeline_dsl.shell import shell, Password
+from pipeline_dsl.shell import shell, shell_lines, shell_many, ashell, ShellPool, Password
 from pipeline_dsl.concourse import *
 from pipeline_dsl.resources import *
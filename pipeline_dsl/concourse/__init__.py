@@ -1,3 +1,6 @@
 from pipeline_dsl.concourse.pipeline import *
 from pipeline_dsl.concourse.job import *
 from pipeline_dsl.concourse.task import *
+from pipeline_dsl.concourse.bundle import GcsBundleStore, DirectoryBundleStore
+from pipeline_dsl.concourse.caches import LocalCaches, cache_path
+from pipeline_dsl.concourse.results import ResultCodec, RESULT_CODECS
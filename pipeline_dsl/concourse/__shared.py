@@ -1,3 +1,4 @@
+import os
 from contextlib import contextmanager
 
 
@@ -6,6 +7,13 @@ SCRIPT_DIR = "scripts"
 __concourse_context = False
 
 
+def local_cache_dir(*parts):
+    root = os.getenv("PIPELINE_DSL_CACHE_DIR")
+    if not root:
+        root = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "pipeline-dsl")
+    return os.path.join(root, *parts)
+
+
 def concourse_context():
     global __concourse_context
     return __concourse_context
@@ -0,0 +1,310 @@
+import os
+import io
+import re
+import sys
+import bz2
+import gzip
+import lzma
+import stat
+import json
+import base64
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import subprocess
+from dataclasses import dataclass
+
+from .__shared import local_cache_dir
+
+BUNDLE_FORMAT = 1
+
+
+class Codec:
+    def __init__(self, name, extension, compress, tar_flag="", decompress_cmd=None):
+        self.name = name
+        self.extension = extension
+        self.compress = compress
+        self.tar_flag = tar_flag
+        self.decompress_cmd = decompress_cmd
+
+    def extract_cmd(self, directory):
+        tar = f"tar -C {directory} -xv{self.tar_flag}f -"
+        if self.decompress_cmd:
+            return f"{self.decompress_cmd} | {tar}"
+        return tar
+
+
+def bz2_compress(data):
+    return bz2.compress(data, 9)
+
+
+def gzip_compress(data):
+    # gzip.compress only accepts mtime since python 3.8
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def xz_compress(data):
+    return lzma.compress(data)
+
+
+def zstd_compress(data):
+    try:
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    except ImportError:
+        return subprocess.run(["zstd", "-q", "-10", "-c", "-"], input=data, stdout=subprocess.PIPE, check=True).stdout
+
+
+def zstd_available():
+    try:
+        import zstandard  # noqa: F401
+
+        return True
+    except ImportError:
+        return shutil.which("zstd") is not None
+
+
+CODECS = {
+    "bz2": Codec("bz2", ".tar.bz2", bz2_compress, tar_flag="j"),
+    "gzip": Codec("gzip", ".tar.gz", gzip_compress, tar_flag="z"),
+    "xz": Codec("xz", ".tar.xz", xz_compress, tar_flag="J"),
+    # not every tar supports --zstd, therefore decompression is piped through the zstd cli
+    "zstd": Codec("zstd", ".tar.zst", zstd_compress, decompress_cmd="zstd -dc"),
+    "none": Codec("none", ".tar", lambda data: data),
+}
+
+
+def get_codec(name) -> Codec:
+    if isinstance(name, Codec):
+        return name
+    if name not in CODECS:
+        raise Exception(f"Unknown bundle codec {name}. List of available codecs: " + " ".join(CODECS.keys()))
+    if name == "zstd" and not zstd_available():
+        print("Warning: neither the zstandard module nor the zstd cli is available, falling back to gzip", file=sys.stderr)
+        name = "gzip"
+    return CODECS[name]
+
+
+@dataclass
+class Bundle:
+    digest: str
+    data: bytes
+
+    def encoded(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+
+def bundled(name, isdir):
+    return isdir or name.endswith(".sh") or name.endswith(".py")
+
+
+def ordered_init_dirs(init_dirs):
+    # nested directories have to be added first, so they take precedence when unpacking
+    return sorted(list(init_dirs.items()), key=lambda d: len(d[1]), reverse=True)
+
+
+def fingerprint(init_dirs, codec=CODECS["bz2"], precompile=None):
+    """
+    Hashes path, mode, size and mtime of every file which ends up in the bundle, mirroring the traversal of tarfile.add
+    """
+    digest = hashlib.sha256(f"format={BUNDLE_FORMAT}\ncodec={codec.name}\nprecompile={precompile}\n".encode("utf-8"))
+
+    def visit(path, arcname):
+        st = os.lstat(path)
+        isdir = stat.S_ISDIR(st.st_mode)
+        if not bundled(arcname, isdir):
+            return
+        link = os.readlink(path) if stat.S_ISLNK(st.st_mode) else ""
+        digest.update(f"{arcname}\0{st.st_mode}\0{st.st_size}\0{st.st_mtime_ns}\0{link}\n".encode("utf-8", "surrogateescape"))
+        if isdir:
+            for child in sorted(os.listdir(path)):
+                visit(os.path.join(path, child), os.path.join(arcname, child))
+
+    for dir_concourse, dir_local in ordered_init_dirs(init_dirs):
+        visit(os.path.abspath(dir_local), dir_concourse)
+    return digest.hexdigest()
+
+
+COMPILE_SCRIPT = """
+import sys, json, os, py_compile, importlib.util
+if "%d.%d" % sys.version_info[:2] != sys.argv[2]:
+    sys.exit(f"python {sys.argv[2]} required")
+for source, arcname in json.load(sys.stdin):
+    cfile = os.path.join(sys.argv[1], importlib.util.cache_from_source(arcname))
+    py_compile.compile(source, cfile=cfile, dfile=arcname, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+"""
+
+
+def compile_sources(sources, target, version):
+    """
+    Compiles the given (path, arcname) pairs to `<target>/<dir of arcname>/__pycache__` with an interpreter of the given version.
+    Bundles are immutable, the bytecode is therefore not validated against the source when importing it.
+    """
+    python = sys.executable if "%d.%d" % sys.version_info[:2] == version else f"python{version}"
+    try:
+        result = subprocess.run([python, "-c", COMPILE_SCRIPT, target, version], input=json.dumps(sources).encode("utf-8"), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except OSError:
+        raise Exception(f"Unable to precompile the bundle, {python} not found") from None
+    if result.returncode != 0:
+        raise Exception(f"Unable to precompile the bundle with {python}: " + result.stderr.decode("utf-8", "replace").strip())
+
+
+def build(init_dirs, codec=CODECS["bz2"], precompile=None):
+    buffer = io.BytesIO()
+    tar = tarfile.open(fileobj=buffer, mode="x")
+    sources = {}
+
+    def normalize(tarinfo):
+        tarinfo.uid = 0
+        tarinfo.gid = 0
+        tarinfo.uname = "root"
+        tarinfo.gname = "root"
+        tarinfo.mtime = 0
+        return tarinfo
+
+    for dir_concourse, dir_local in ordered_init_dirs(init_dirs):
+        dir_local = os.path.abspath(dir_local)
+
+        def filter(tarinfo):
+            if not bundled(tarinfo.name, tarinfo.isdir()):
+                return None
+            if tarinfo.name.endswith(".py") and tarinfo.isfile():
+                sources[tarinfo.name] = os.path.join(dir_local, os.path.relpath(tarinfo.name, dir_concourse))
+            return normalize(tarinfo)
+
+        tar.add(dir_local, arcname=dir_concourse, filter=filter)
+    if precompile and sources:
+        with tempfile.TemporaryDirectory() as target:
+            compile_sources([(source, arcname) for arcname, source in sorted(sources.items())], target, precompile)
+            for root, _, files in sorted(os.walk(target)):
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    tar.add(path, arcname=os.path.relpath(path, target), filter=normalize)
+    tar.close()
+    return codec.compress(buffer.getvalue())
+
+
+class BundleCache:
+    """
+    Pipeline scoped cache of packaged init_dirs. Bundles are keyed by the fingerprint of their content and
+    persisted in `directory` (disabled if empty), so an unchanged tree is only compressed once across invocations.
+    If `precompile` is a python version (e.g. "3.8"), the bytecode of all modules is included in the bundle.
+    """
+
+    def __init__(self, directory=None, codec="bz2", precompile=None):
+        self.directory = local_cache_dir("bundles") if directory is None else directory
+        self.codec = get_codec(codec)
+        self.precompile = precompile
+        self.bundles = {}
+        self.fingerprints = {}
+
+    def bundle(self, init_dirs) -> Bundle:
+        key = tuple(sorted(init_dirs.items()))
+        digest = self.fingerprints.get(key)
+        if digest is None:
+            digest = fingerprint(init_dirs, self.codec, self.precompile)
+            self.fingerprints[key] = digest
+        bundle = self.bundles.get(digest)
+        if bundle is None:
+            data = self.__load(digest)
+            if data is None:
+                data = build(init_dirs, self.codec, self.precompile)
+                self.__store(digest, data)
+            bundle = Bundle(digest, data)
+            self.bundles[digest] = bundle
+        return bundle
+
+    def package(self, init_dirs) -> str:
+        return self.bundle(init_dirs).encoded()
+
+    def __path(self, digest):
+        return os.path.join(self.directory, digest + self.codec.extension)
+
+    def __load(self, digest):
+        if not self.directory:
+            return None
+        try:
+            with open(self.__path(digest), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __store(self, digest, data):
+        if not self.directory:
+            return
+        # the cache is an optimization only, failing to write it must not break the pipeline
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{self.__path(digest)}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.__path(digest))
+        except OSError:
+            pass
+
+
+class GcsBundleStore:
+    """
+    Publishes bundles to a google cloud storage bucket under their content hash. Jobs fetch the bundle with a `get` step
+    of the resource `name`, so only the hash ends up in the pipeline configuration instead of the whole bundle.
+    """
+
+    def __init__(self, bucket, credentials, prefix="pipeline-dsl/bundles/", name="script-bundle"):
+        self.bucket = bucket
+        self.credentials = credentials
+        self.prefix = prefix
+        self.name = name
+
+    def key(self, bundle, codec):
+        return f"{self.prefix}{bundle.digest}{codec.extension}"
+
+    def resource(self, bundle, codec):
+        # imported here, the resources import pipeline_dsl.concourse themselves
+        from pipeline_dsl.resources import GoogleCloudStorage
+
+        # the regexp only matches the current bundle, i.e. the resource has exactly one version
+        # and a new bundle changes the resource configuration, which makes concourse check it again
+        regexp = re.escape(self.prefix) + f"({bundle.digest})" + re.escape(codec.extension)
+        return GoogleCloudStorage(self.bucket, regexp, self.credentials)
+
+    def url(self, key):
+        return f"gs://{self.bucket}/{key}"
+
+    def exists(self, key):
+        return subprocess.run(["gsutil", "-q", "stat", self.url(key)]).returncode == 0
+
+    def upload(self, key, data):
+        subprocess.run(["gsutil", "-q", "cp", "-", self.url(key)], input=data, check=True)
+
+    def publish(self, bundle, codec):
+        key = self.key(bundle, codec)
+        if not self.exists(key):
+            print(f"Publishing script bundle {self.url(key)}")
+            self.upload(key, bundle.data)
+        return key
+
+
+class DirectoryBundleStore(GcsBundleStore):
+    """
+    Stores bundles in a local directory instead of the bucket, e.g. for tests. The pipeline configuration still refers to the bucket.
+    """
+
+    def __init__(self, directory, bucket="local", credentials="", **kwargs):
+        super().__init__(bucket, credentials, **kwargs)
+        self.directory = directory
+
+    def url(self, key):
+        return os.path.join(self.directory, key)
+
+    def exists(self, key):
+        return os.path.exists(self.url(key))
+
+    def upload(self, key, data):
+        os.makedirs(os.path.dirname(self.url(key)), exist_ok=True)
+        with open(self.url(key), "wb") as f:
+            f.write(data)
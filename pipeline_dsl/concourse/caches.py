@@ -0,0 +1,84 @@
+import os
+import glob
+import shutil
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from .__shared import local_cache_dir
+from .lru import directory_size, evict, touch
+
+_mounted = contextvars.ContextVar("pipeline_dsl_caches", default=None)
+
+
+def cache_path(path):
+    """
+    Directory of the cache `path` declared in `caches` of the running task. This is the path in the working directory
+    on concourse and a persistent directory of the task locally.
+    """
+    mounted = _mounted.get()
+    if mounted and path in mounted:
+        return mounted[path]
+    return os.path.abspath(path)
+
+
+class LocalCaches:
+    """
+    Emulates the `caches` of concourse tasks in local runs: every cache path of a task is mapped to a persistent
+    directory keyed by job, task and path. The least recently used directories of all tasks are evicted once their total
+    size grows beyond `max_bytes`, directories of running tasks are never evicted.
+    """
+
+    def __init__(self, directory=None, max_bytes=10 * 1024 * 1024 * 1024):
+        self.directory = local_cache_dir("caches") if directory is None else directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.active = Counter()
+        # sizes of directories released by this process, others are measured once on the first eviction
+        self.sizes = {}
+
+    def path(self, jobname, taskname, cache):
+        return os.path.join(self.directory, jobname, taskname, quote(cache.strip("/"), safe=""))
+
+    @contextmanager
+    def mounted(self, jobname, taskname, caches):
+        dirs = dict((cache, self.path(jobname, taskname, cache)) for cache in caches)
+        with self.lock:
+            for dir in dirs.values():
+                os.makedirs(dir, exist_ok=True)
+                self.active[dir] += 1
+        token = _mounted.set(dirs)
+        try:
+            yield dirs
+        finally:
+            _mounted.reset(token)
+            self.__release(dirs.values())
+
+    def __release(self, dirs):
+        with self.lock:
+            for dir in dirs:
+                touch(dir)
+                self.sizes[dir] = directory_size(dir)
+                self.active[dir] -= 1
+                if not self.active[dir]:
+                    del self.active[dir]
+            total, evicted = evict(self.directory, os.path.join("*", "*", "*"), self.max_bytes, keep=set(self.active), sizes=self.sizes)
+            for dir in evicted:
+                self.sizes.pop(dir, None)
+        if evicted:
+            print(f"Evicted {len(evicted)} cache directories, {total / 1024 / 1024:.0f}MiB of caches in use")
+
+    def usage(self):
+        return dict((dir, directory_size(dir)) for dir in sorted(glob.glob(os.path.join(self.directory, "*", "*", "*"))))
+
+    def clear(self, jobname=None, taskname=None):
+        path = self.directory
+        if jobname:
+            path = os.path.join(path, jobname)
+            if taskname:
+                path = os.path.join(path, taskname)
+        shutil.rmtree(path, ignore_errors=True)
+        with self.lock:
+            self.sizes = dict((dir, size) for dir, size in self.sizes.items() if os.path.exists(dir))
@@ -1,17 +1,40 @@
 import os
+import glob
 import shutil
+import threading
+import contextvars
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, wait
 
-from .__shared import concourse_context
+from pipeline_dsl import output, trace
+from .__shared import CACHE_DIR, concourse_context
 from .task import InitTask, Task
+from .memo import tree_digest
 
 
 class Job:
-    def __init__(self, name, script, init_dirs, image_resource, resource_chains, secret_manager, serial, serial_groups, old_name, groups):
+    def __init__(
+        self,
+        name,
+        script,
+        init_dirs,
+        image_resource,
+        resource_chains,
+        secret_manager,
+        serial,
+        serial_groups,
+        old_name,
+        groups,
+        bundle_cache=None,
+        memo=None,
+        bundle_store=None,
+        local_caches=None,
+        result_codec="json",
+    ):
         self.name = name
         self.groups = groups
         self.old_name = old_name
-        self.plan = [InitTask(init_dirs, image_resource)]
+        self.plan = [InitTask(init_dirs, image_resource, bundle_cache, bundle_store)]
         self.image_resource = image_resource
         self.resource_chains = resource_chains
         self.script = script
@@ -24,8 +47,70 @@ class Job:
         self.on_abort = None
         self.ensure = None
         self.secret_manager = secret_manager
+        self.memo = memo
+        self.local_caches = local_caches
+        self.result_codec = result_codec
+        self.body = None
+        self.prepare = None
+
+    def input_versions(self, inputs):
+        inputs = list(inputs)
+
+        def versions():
+            result = {}
+            for name in inputs:
+                resource_chain = self.resource_chains.get(name, None) if isinstance(name, str) else None
+                if resource_chain:
+                    result[name] = resource_version(resource_chain.resource.get(name))
+            for dir in glob.glob(os.path.join("/tmp", "outputs", self.name, "*")):
+                result[os.path.basename(dir)] = tree_digest(dir)
+            return result
+
+        return versions
+
+    def changed_files(self, resource=None):
+        """
+        Returns a function listing the files changed by the given resource, by default the only input of the job providing them
+        (e.g. a github PR). The function returns None outside of concourse, where the changes aren't known.
+        """
+        inputs = self.inputs
+
+        def changes():
+            if not concourse_context():
+                return None
+            candidates = [resource] if resource else []
+            if not resource:
+                for name in inputs:
+                    resource_chain = self.resource_chains.get(name, None) if isinstance(name, str) else None
+                    if resource_chain and hasattr(resource_chain.resource.get(name), "iter_changed_files"):
+                        candidates.append(resource_chain.resource.get(name))
+            if len(candidates) != 1:
+                raise Exception(f"Job {self.name} needs exactly one resource providing changed files for paths, pass it with changes=")
+            return candidates[0].iter_changed_files()
+
+        return changes
+
+    def __call__(self, body):
+        """
+        Registers the body of the job to be evaluated lazily, i.e. only if the job is needed:
+
+            @pipeline.job("build")
+            def build(job):
+                ...
+        """
+        self.body = body
+        return self
+
+    def materialize(self):
+        if self.body:
+            body, self.body = self.body, None
+            if self.prepare:
+                self.prepare()
+            body(self)
 
     def __enter__(self):
+        if self.prepare:
+            self.prepare()
         return self
 
     def __exit__(self, type, value, tb):
@@ -51,14 +136,26 @@ class Job:
         self.inputs.append(name)
         return resource_chain.resource.get(name)
 
-    def task(self, image_resource=None, inputs=None, **kwargs):
+    def task(self, image_resource=None, inputs=None, changes=None, **kwargs):
         if not image_resource:
             image_resource = self.image_resource
 
         def decorate(fun):
             if inputs:
                 self.inputs.append(inputs)
-            task = Task(fun=fun, jobname=self.name, secret_manager=self.secret_manager, image_resource=image_resource, script=self.script, inputs=self.inputs, **kwargs)
+            task = Task(
+                fun=fun,
+                jobname=self.name,
+                secret_manager=self.secret_manager,
+                image_resource=image_resource,
+                script=self.script,
+                inputs=self.inputs,
+                memo=self.memo,
+                local_caches=self.local_caches,
+                input_versions=self.input_versions(self.inputs),
+                changed_files=self.changed_files(changes),
+                **{"result_codec": self.result_codec, **kwargs},
+            )
 
             self.plan.append(task)
             self.tasks[task.name] = task
@@ -66,12 +163,13 @@ class Job:
 
         return decorate
 
-    def in_parallel(self, fail_fast=False):
-        parallel_task = ParallelStep(self, fail_fast, self.secret_manager)
+    def in_parallel(self, fail_fast=False, limit=None):
+        parallel_task = ParallelStep(self, fail_fast, self.secret_manager, limit)
         self.plan.append(parallel_task)
         return parallel_task
 
     def concourse(self):
+        self.materialize()
         obj = {
             "name": self.name.replace("_", "-"),
             "plan": list(map(lambda x: x.concourse(), self.plan)),
@@ -90,26 +188,53 @@ class Job:
             obj["old_name"] = self.old_name
         return obj
 
-    def __cleanup_outputs(self):
+    def __cleanup(self):
         if not concourse_context():
             try:
                 shutil.rmtree(os.path.join("/tmp", "outputs", self.name))
             except FileNotFoundError:
                 pass
-
-    def run(self):
-        self.__cleanup_outputs()
-        for _, v in self.tasks.items():
-            v.fn_cached()
+            # results of a previous run would be read by fn_cached, even if the tasks or their inputs changed since then
+            shutil.rmtree(os.path.join(CACHE_DIR, self.name), ignore_errors=True)
+
+    def run(self, max_parallelism=1, aborted=None):
+        with trace.span(self.name, "job"):
+            self.materialize()
+            self.__cleanup()
+            for step in self.plan:
+                check_aborted(aborted, self.name)
+                if isinstance(step, Task):
+                    step.fn_cached()
+                elif isinstance(step, ParallelStep):
+                    step.run(max_parallelism, aborted)
 
     def run_task(self, name):
-        self.__cleanup_outputs()
+        self.materialize()
+        self.__cleanup()
         task = self.tasks.get(name, None)
         if not task:
             task = self.tasks.get(name.replace("_", "-"), None)
         if not task:
             raise Exception(f"Task {name} not configured inside job {self.name}")
-        return task.fn_cached()
+        # the requested task is always executed, other tasks run again if their results are needed (unless memoized)
+        with trace.span(self.name, "job"):
+            return task.fn()
+
+
+def check_aborted(aborted, name):
+    # the pipeline run was interrupted, e.g. by a KeyboardInterrupt in the main thread
+    if aborted is not None and aborted.is_set():
+        raise Exception(f"{name} aborted")
+
+
+def resource_version(resource):
+    for method in ["ref", "version", "digest", "tag"]:
+        if callable(getattr(resource, method, None)):
+            try:
+                return getattr(resource, method)()
+            except Exception:
+                return None
+    return None
 
 
 class GetStep:
@@ -170,18 +295,31 @@ class DoStep:
 
 
 class ParallelStep:
-    def __init__(self, job, fail_fast, secret_manager=None):
+    def __init__(self, job, fail_fast, secret_manager=None, limit=None):
         self.job = job
         self.tasks = []
         self.fail_fast = fail_fast
         self.secret_manager = secret_manager
+        self.limit = limit
 
-    def task(self, image_resource=None, **kwargs):
+    def task(self, image_resource=None, changes=None, **kwargs):
         if not image_resource:
             image_resource = self.job.image_resource
 
         def decorate(fun):
-            task = Task(fun=fun, jobname=self.job.name, secret_manager=self.secret_manager, image_resource=image_resource, script=self.job.script, inputs=self.job.inputs, **kwargs)
+            task = Task(
+                fun=fun,
+                jobname=self.job.name,
+                secret_manager=self.secret_manager,
+                image_resource=image_resource,
+                script=self.job.script,
+                inputs=self.job.inputs,
+                memo=self.job.memo,
+                local_caches=self.job.local_caches,
+                input_versions=self.job.input_versions(self.job.inputs),
+                changed_files=self.job.changed_files(changes),
+                **{"result_codec": self.job.result_codec, **kwargs},
+            )
             self.tasks.append(task)
             self.job.tasks[task.name] = task
             return task.fn_cached
@@ -208,10 +346,64 @@ class ParallelStep:
     def put(self, name, params=None, get_params=None):
         self.tasks.append(PutStep(name, params, get_params))
 
+    def run(self, max_parallelism=1, aborted=None):
+        tasks = [task for task in self.tasks if isinstance(task, Task)]
+        workers = min(filter(None, [len(tasks), self.limit, max_parallelism]))
+        if workers <= 1:
+            failures = []
+            for task in tasks:
+                check_aborted(aborted, self.job.name)
+                try:
+                    task.fn_cached()
+                except Exception as e:
+                    if self.fail_fast:
+                        raise
+                    # like concourse, the remaining steps still run without fail_fast
+                    failures.append(e)
+            if failures:
+                raise failures[0]
+            return
+
+        stopped = threading.Event()
+
+        def run_captured(task):
+            if stopped.is_set():
+                return None
+            check_aborted(aborted, self.job.name)
+            # output is printed in one piece, once the task is finished, to keep logs of concurrent tasks readable
+            with output.captured():
+                try:
+                    return task.fn_cached()
+                except Exception:
+                    if self.fail_fast:
+                        stopped.set()
+                    raise
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = []
+        try:
+            with output.routed():
+                futures = [executor.submit(contextvars.copy_context().run, run_captured, task) for task in tasks]
+                wait(futures, return_when=ALL_COMPLETED)
+        except BaseException:
+            # e.g. KeyboardInterrupt, tasks which didn't start yet are skipped and running ones aren't waited for
+            stopped.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
+        for future in futures:
+            if future.exception():
+                raise future.exception()
+
     def concourse(self):
-        return {
+        result = {
             "in_parallel": {
                 "fail_fast": self.fail_fast,
                 "steps": [task.concourse() for task in self.tasks],
             },
         }
+        if self.limit is not None:
+            result["in_parallel"]["limit"] = self.limit
+        return result
@@ -0,0 +1,51 @@
+import os
+import json
+
+from .__shared import local_cache_dir
+
+SECTIONS = ["jobs", "resources", "resource_types"]
+
+
+class FlyLedger:
+    """
+    Remembers the digest of the last configuration uploaded per target and pipeline
+    """
+
+    def __init__(self, path=None):
+        self.path = local_cache_dir("fly-ledger.json") if path is None else path
+
+    def __load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, target, team, name):
+        return self.__load().get(f"{target}/{team}/{name}")
+
+    def update(self, target, team, name, entry):
+        entries = self.__load()
+        entries[f"{target}/{team}/{name}"] = entry
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def diff(old, new):
+    old = old or {}
+    changes = []
+    for section in SECTIONS:
+        before = old.get(section, {})
+        after = new.get(section, {})
+        for name, digest in after.items():
+            if name not in before:
+                changes.append(f"+ {section} {name}")
+            elif before[name] != digest:
+                changes.append(f"~ {section} {name}")
+        for name in before:
+            if name not in after:
+                changes.append(f"- {section} {name}")
+    return changes
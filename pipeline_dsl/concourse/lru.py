@@ -0,0 +1,51 @@
+import os
+import glob
+import shutil
+
+
+def directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def last_used(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+
+def evict(root, pattern, max_bytes, keep=(), sizes=None):
+    """
+    Removes the least recently used entries (directories matching `pattern` below `root`) until the total size fits into `max_bytes`.
+    The last use of an entry is tracked by the modification time of its directory (see `touch`). Sizes of entries missing
+    in `sizes` are measured and added to it.
+    """
+    entries = sorted(glob.glob(os.path.join(root, pattern)), key=last_used, reverse=True)
+    sizes = {} if sizes is None else sizes
+    for entry in entries:
+        if entry not in sizes:
+            sizes[entry] = directory_size(entry)
+    total = sum(sizes[entry] for entry in entries)
+    evicted = []
+    while total > max_bytes and entries:
+        entry = entries.pop()
+        if entry in keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= sizes[entry]
+        evicted.append(entry)
+    return total, evicted
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import inspect
+import marshal
+
+from .__shared import local_cache_dir
+from .lru import evict, touch
+from .results import get_result_codec
+
+META_FILE = "meta.json"
+RESULT_FILE = "result"
+OUTPUTS_DIR = "outputs"
+SIMPLE_TYPES = (str, int, float, bool, type(None), list, tuple, dict)
+
+
+def source_digest(fun):
+    digest = hashlib.sha256()
+    try:
+        digest.update(inspect.getsource(fun).encode("utf-8"))
+    except (OSError, TypeError):
+        digest.update(marshal.dumps(fun.__code__))
+    # values captured from the pipeline definition are part of the task's identity as well
+    for cell in fun.__closure__ or []:
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            continue
+        if isinstance(value, SIMPLE_TYPES):
+            digest.update(repr(value).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def tree_digest(path):
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file = os.path.join(dirpath, filename)
+            st = os.lstat(file)
+            digest.update(f"{os.path.relpath(file, path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
+
+
+class MemoHit:
+    def __init__(self, result):
+        self.result = result
+
+
+class TaskMemo:
+    """
+    Persistent cache of task results (and outputs) for local runs. Entries are keyed by job, task, the source of the
+    task function, the versions of its inputs and the results of the tasks it references. Entries expire after `ttl` seconds and the least recently used entries
+    are evicted once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, directory=None, ttl=None, max_bytes=1024 * 1024 * 1024):
+        self.directory = local_cache_dir("results") if directory is None else directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def key(self, jobname, taskname, fun, inputs, results={}):
+        identity = {
+            "job": jobname,
+            "task": taskname,
+            "source": source_digest(fun),
+            "inputs": inputs,
+            "results": results,
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def __entry(self, jobname, taskname, key):
+        return os.path.join(self.directory, jobname, taskname, key)
+
+    def load(self, jobname, taskname, key, outputs={}):
+        entry = self.__entry(jobname, taskname, key)
+        try:
+            with open(os.path.join(entry, META_FILE)) as f:
+                meta = json.load(f)
+            codec = get_result_codec(meta.get("codec", "json"))
+            result = codec.load(os.path.join(entry, RESULT_FILE + codec.extension))
+        except (OSError, ValueError, EOFError):
+            return None
+        if self.ttl is not None and time.time() - meta["created"] > self.ttl:
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        for name, dir in outputs.items():
+            shutil.rmtree(dir, ignore_errors=True)
+            shutil.copytree(os.path.join(entry, OUTPUTS_DIR, name), dir, symlinks=True)
+        touch(entry)
+        return MemoHit(result)
+
+    def store(self, jobname, taskname, key, result, outputs={}, codec="json"):
+        codec = get_result_codec(codec)
+        entry = self.__entry(jobname, taskname, key)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, dir in outputs.items():
+            shutil.copytree(dir, os.path.join(tmp, OUTPUTS_DIR, name), symlinks=True)
+        codec.dump(result, os.path.join(tmp, RESULT_FILE + codec.extension))
+        with open(os.path.join(tmp, META_FILE), "w") as f:
+            json.dump({"created": time.time(), "codec": codec.name}, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmp, entry)
+        evict(self.directory, os.path.join("*", "*", "*"), self.max_bytes, keep=[entry])
+
+    def invalidate(self, jobname=None, taskname=None):
+        path = self.directory
+        if jobname:
+            path = os.path.join(path, jobname)
+            if taskname:
+                path = os.path.join(path, taskname)
+        shutil.rmtree(path, ignore_errors=True)
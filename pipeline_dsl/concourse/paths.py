@@ -0,0 +1,75 @@
+import re
+import fnmatch
+
+
+class Node:
+    def __init__(self):
+        self.literals = {}
+        self.wildcards = {}
+        self.globstar = None
+        self.terminal = False
+
+    def child(self, segment):
+        if segment == "**":
+            if not self.globstar:
+                self.globstar = Node()
+            return self.globstar
+        if any(c in segment for c in "*?["):
+            if segment not in self.wildcards:
+                self.wildcards[segment] = (re.compile(fnmatch.translate(segment)).match, Node())
+            return self.wildcards[segment][1]
+        return self.literals.setdefault(segment, Node())
+
+
+class PathMatcher:
+    """
+    Matches paths against a set of glob patterns like the `paths` of the git resource: `*` and `?` don't match `/`,
+    `**` matches any number of directories and a pattern matching a directory matches everything below it.
+    The patterns are compiled into a trie of path segments, so a path is only compared with patterns sharing its prefix.
+    """
+
+    def __init__(self, patterns):
+        self.root = Node()
+        for pattern in patterns:
+            node = self.root
+            for segment in pattern.strip("/").split("/"):
+                if segment:
+                    node = node.child(segment)
+            node.terminal = True
+
+    def match(self, path):
+        segments = path.strip("/").split("/")
+        visited = set()
+
+        def visit(node, i):
+            if node.terminal:
+                return True
+            if (id(node), i) in visited:
+                return False
+            visited.add((id(node), i))
+            if node.globstar and any(visit(node.globstar, j) for j in range(i, len(segments) + 1)):
+                return True
+            if i == len(segments):
+                return False
+            segment = segments[i]
+            if segment in node.literals and visit(node.literals[segment], i + 1):
+                return True
+            return any(match(segment) and visit(child, i + 1) for match, child in node.wildcards.values())
+
+        return visit(self.root, 0)
+
+
+class PathFilter:
+    """
+    Decides whether a change is relevant: a changed file matching `paths` (all files if empty) and not `ignore_paths`
+    """
+
+    def __init__(self, paths=None, ignore_paths=None):
+        self.paths = PathMatcher(paths) if paths else None
+        self.ignore_paths = PathMatcher(ignore_paths) if ignore_paths else None
+
+    def relevant(self, path):
+        return (not self.paths or self.paths.match(path)) and not (self.ignore_paths and self.ignore_paths.match(path))
+
+    def affected(self, changed_files):
+        return any(self.relevant(path) for path in changed_files)
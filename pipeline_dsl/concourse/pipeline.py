@@ -4,9 +4,18 @@ import shutil
 import subprocess
 import argparse
 import inspect
+from contextlib import contextmanager
 
+from pipeline_dsl import stats, trace
 from .__shared import CACHE_DIR, SCRIPT_DIR, concourse_context, set_concourse_context
 from .job import Job
+from .scheduler import JobScheduler
+from .bundle import BundleCache
+from .ledger import FlyLedger, diff
+from .memo import TaskMemo
+from .caches import LocalCaches
+from .results import get_result_codec
+from .secrets import VaultSecretManager
 from .task import STARTER_DIR, PYTHON_DIR
 
 
@@ -19,10 +28,25 @@ def vault_secret_manager(key):
 
 
 class Pipeline:
-    def __init__(self, name, image_resource={"type": "registry-image", "source": {"repository": "python", "tag": "3.8-buster"}}, script_dirs={}, team="main"):
-        frame = inspect.stack()[1]
-        module = inspect.getmodule(frame[0])
-        self.script = module.__file__
+    def __init__(
+        self,
+        name,
+        image_resource={"type": "registry-image", "source": {"repository": "python", "tag": "3.8-buster"}},
+        script_dirs={},
+        team="main",
+        codec="bz2",
+        script=None,
+        bundle_store=None,
+        precompile=None,
+        cache_root=None,
+        result_codec="json",
+    ):
+        if not script:
+            # inspect.stack() would load the source context of every frame
+            script = sys._getframe(1).f_globals.get("__file__")
+            if not script:
+                raise Exception("Unable to determine the pipeline script, please pass script=__file__")
+        self.script = script
         dirname = os.path.abspath(os.path.dirname(self.script))
         lib_dir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
         self.init_dirs = {
@@ -44,11 +68,22 @@ class Pipeline:
         self.image_resource = image_resource
         self.team = team
         self.secret_manager = env_secret_manager
+        self.bundle_cache = BundleCache(codec=codec, precompile=precompile)
+        self.bundle_store = bundle_store
+        self.max_parallelism = os.cpu_count() or 1
+        self.memo = TaskMemo()
+        self.local_caches = LocalCaches(cache_root)
+        self.result_codec = get_result_codec(result_codec)
 
     def __create_secret_manager(self):
         def namespaced_secret_manager(key):
             return self.secret_manager(os.path.join("/concourse", self.team, key))
 
+        def prefetch(keys):
+            if hasattr(self.secret_manager, "prefetch"):
+                self.secret_manager.prefetch([os.path.join("/concourse", self.team, key) for key in keys])
+
+        namespaced_secret_manager.prefetch = prefetch
         return namespaced_secret_manager
 
     def script_dir(self, key):
@@ -66,15 +101,33 @@ class Pipeline:
         parser.add_argument("--job", help="name of the job to run")
         parser.add_argument("--task", help="name of the task to run")
         parser.add_argument("--target", help="upload concourse yaml to the given target")
+        parser.add_argument("--force", dest="force", action="store_true", help="upload concourse yaml even if it is unchanged since the last upload")
+        parser.add_argument("--diff-only", dest="diff_only", action="store_true", help="print jobs and resources changed since the last upload to the target")
         parser.add_argument("--concourse", dest="concourse", action="store_true", help="set concourse context to true")
-        parser.add_argument("--secret-manager", default="env", choices=["env", "vault"], help="set secret manager")
+        parser.add_argument("--secret-manager", default="env", choices=["env", "vault", "vault-http"], help="set secret manager")
         parser.add_argument("--dump", dest="dump", action="store_true", help="dump concourse yaml")
+        parser.add_argument("--compact", dest="compact", action="store_true", help="use yaml anchors and aliases for repeated parts of the concourse yaml")
+        parser.add_argument("--max-parallelism", type=int, help="maximum number of tasks running in parallel locally")
+        parser.add_argument("--invalidate-cache", dest="invalidate_cache", action="store_true", help="drop cached results of memoized tasks (of the given job/task)")
+        parser.add_argument("--cache-root", dest="cache_root", help="directory of the persistent task caches used locally")
+        parser.add_argument("--clear-caches", dest="clear_caches", action="store_true", help="clear the local task caches (of the given job/task)")
+        parser.add_argument("--trace", help="write a chrome trace (chrome://tracing, ui.perfetto.dev) of the local run to the given file")
 
         self.args = parser.parse_args()
 
         set_concourse_context(self.args.concourse)
+        if self.args.max_parallelism:
+            self.max_parallelism = self.args.max_parallelism
+        if self.args.invalidate_cache:
+            self.memo.invalidate(self.args.job, self.args.task)
+        if self.args.cache_root:
+            self.local_caches.directory = os.path.abspath(self.args.cache_root)
+        if self.args.clear_caches:
+            self.local_caches.clear(self.args.job, self.args.task)
         if self.args.secret_manager == "vault":
             self.secret_manager = vault_secret_manager
+        elif self.args.secret_manager == "vault-http":
+            self.secret_manager = VaultSecretManager()
 
         return self
 
@@ -83,9 +136,20 @@ class Pipeline:
             self.main()
 
     def run(self):
-        shutil.rmtree(CACHE_DIR, ignore_errors=True)
-        for job in self.jobs:
-            job.run()
+        self.__materialize()
+        cache_dir = os.path.abspath(CACHE_DIR)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        scheduler = JobScheduler(self.jobs, self.max_parallelism)
+        try:
+            scheduler.run(lambda job: job.run(self.max_parallelism, scheduler.aborted))
+        finally:
+            records = stats.load(cache_dir)
+            if records:
+                print("\n".join(stats.summary(records)))
+                rss = stats.peak_rss()
+                if rss:
+                    print(rss)
+        scheduler.report()
 
     def run_task(self, job, task):
         if job in self.jobs_by_name:
@@ -95,17 +159,47 @@ class Pipeline:
 
     def job(self, name, serial=False, serial_groups=[], old_name=None, groups=[]):
         result = Job(
-            name, self.script, self.init_dirs, self.image_resource, self.resource_chains, self.__create_secret_manager(), serial=serial, serial_groups=serial_groups, old_name=old_name, groups=groups
+            name,
+            self.script,
+            self.init_dirs,
+            self.image_resource,
+            self.resource_chains,
+            self.__create_secret_manager(),
+            serial=serial,
+            serial_groups=serial_groups,
+            old_name=old_name,
+            groups=groups,
+            bundle_cache=self.bundle_cache,
+            memo=self.memo,
+            bundle_store=self.bundle_store,
+            local_caches=self.local_caches,
+            result_codec=self.result_codec,
         )
+        # jobs declared before have to be evaluated first, so passed="auto" sees their get and put steps
+        result.prepare = lambda: self.__materialize(until=result)
         self.jobs.append(result)
         self.jobs_by_name[name] = result
         return result
 
+    def __materialize(self, until=None):
+        # a single task doesn't need any other job, lazy jobs are only evaluated on demand
+        if getattr(self, "args", None) and self.args.job:
+            return
+        for job in self.jobs:
+            if job is until:
+                break
+            job.materialize()
+
+    def __bundle_resource(self):
+        # the resource of the bundle store depends on the content of the bundle, it is declared when rendering the configuration
+        if self.bundle_store:
+            self.resource(self.bundle_store.name, self.bundle_store.resource(self.bundle_cache.bundle(self.init_dirs), self.bundle_cache.codec))
+
     def resource(self, name, resource):
         self.resource_chains[name] = ResourceChain(resource)
         self.resource_types[resource.__class__.__name__] = resource
 
-    def concourse(self):
+    def __groups(self):
         groups = {}
         for job in self.jobs:
             for group_name in job.groups:
@@ -113,45 +207,123 @@ class Pipeline:
                     groups[group_name].append(job.name)
                 else:
                     groups[group_name] = [job.name]
+        return [{"name": name, "jobs": jobs} for name, jobs in groups.items()]
 
+    def __metadata(self):
         return {
-            "pipeline_metadata": {
-                "name": self.name,
-                "team": self.team,
-            },
-            "resource_types": list(filter(lambda x: x, map(lambda kv: kv[1].resource_type(), self.resource_types.items()))),
-            "resources": list(map(lambda kv: kv[1].resource.concourse(kv[0]), self.resource_chains.items())),
+            "name": self.name,
+            "team": self.team,
+        }
+
+    def __resource_types(self):
+        return filter(lambda x: x, map(lambda kv: kv[1].resource_type(), self.resource_types.items()))
+
+    def __resources(self):
+        return map(lambda kv: kv[1].resource.concourse(kv[0]), self.resource_chains.items())
+
+    def concourse(self):
+        self.__materialize()
+        self.__bundle_resource()
+        return {
+            "pipeline_metadata": self.__metadata(),
+            "resource_types": list(self.__resource_types()),
+            "resources": list(self.__resources()),
             "jobs": list(map(lambda x: x.concourse(), self.jobs)),
-            "groups": [{"name": name, "jobs": jobs} for name, jobs in groups.items()],
+            "groups": self.__groups(),
         }
 
+    def dump(self, stream, compact=False):
+        from pipeline_dsl.utils.dumper import YamlStreamWriter
+
+        self.__materialize()
+        self.__bundle_resource()
+        if compact:
+            return self.__dump_compact(stream)
+        # jobs are rendered one after another instead of building the whole document in memory
+        writer = YamlStreamWriter(stream)
+        writer.sequence("groups", self.__groups())
+        writer.sequence("jobs", map(lambda x: x.concourse(), self.jobs))
+        writer.mapping("pipeline_metadata", self.__metadata())
+        writer.sequence("resource_types", self.__resource_types())
+        writer.sequence("resources", self.__resources())
+        return {"digest": writer.digest(), **writer.digests}
+
+    def __dump_compact(self, stream):
+        import yaml
+        from pipeline_dsl.utils.dumper import YamlStreamWriter, CompactDumper, SubtreeInterner, ByteCounter
+
+        document = self.concourse()
+        # digests are taken from the expanded form, so they don't depend on the output mode
+        counter = ByteCounter()
+        writer = YamlStreamWriter(counter)
+        for key in sorted(document.keys()):
+            if isinstance(document[key], list):
+                writer.sequence(key, document[key])
+            else:
+                writer.mapping(key, document[key])
+        interner = SubtreeInterner()
+        text = yaml.dump(interner.intern(document), allow_unicode=True, Dumper=CompactDumper)
+        stream.write(text)
+        size = len(text.encode("utf-8"))
+        print(f"Compact yaml: {size} bytes instead of {counter.size} bytes, {counter.size - size} bytes saved by {len(interner.shared)} repeated subtrees", file=sys.stderr)
+        return {"digest": writer.digest(), **writer.digests}
+
+    def upload(self, target, force=False, diff_only=False, compact=False, ledger=None):
+        ledger = ledger if ledger else FlyLedger()
+        config_file = f"/tmp/{self.name}.yaml"
+        with open(config_file, "w") as f:
+            entry = self.dump(f, compact=compact)
+        previous = ledger.get(target, self.team, self.name)
+        if diff_only:
+            for change in diff(previous, entry):
+                print(change)
+            return
+        if previous and previous["digest"] == entry["digest"] and not force:
+            print(f"Pipeline {self.name} unchanged on target {target}, skipping set-pipeline")
+            return
+        if self.bundle_store:
+            self.bundle_store.publish(self.bundle_cache.bundle(self.init_dirs), self.bundle_cache.codec)
+        subprocess.run(["fly", "-t", target, "set-pipeline", "-c", config_file, "-p", self.name, "-n"], check=True)
+        ledger.update(target, self.team, self.name, entry)
+
     def main(self):
-        if self.args.dump:
-            from pipeline_dsl.utils.dumper import NoTagDumper
-            import yaml
-
-            yaml.dump(self.concourse(), sys.stdout, allow_unicode=True, Dumper=NoTagDumper)
-            # fly -t concourse-sapcloud-garden set-pipeline -c  test.yaml -p "create-cluster"
-        elif self.args.target:
-            from pipeline_dsl.utils.dumper import NoTagDumper
-            import yaml
-
-            config_file = f"/tmp/{self.name}.yaml"
-            with open(config_file, "w") as f:
-                yaml.dump(self.concourse(), f, allow_unicode=True, Dumper=NoTagDumper)
-            subprocess.run(["fly", "-t", self.args.target, "set-pipeline", "-c", config_file, "-p", self.name, "-n"], check=True)
-        elif self.args.job:
-            try:
-                print(self.run_task(self.args.job, self.args.task))
-            except Exception as e:
-                self.__print_error(e)
-                sys.exit(1)
-        else:
-            try:
-                print(self.run())
-            except Exception as e:
-                self.__print_error(e)
-                sys.exit(1)
+        try:
+            if self.args.dump:
+                self.dump(sys.stdout, compact=self.args.compact)
+                # fly -t concourse-sapcloud-garden set-pipeline -c  test.yaml -p "create-cluster"
+            elif self.args.target:
+                self.upload(self.args.target, force=self.args.force, diff_only=self.args.diff_only, compact=self.args.compact)
+            elif self.args.job:
+                with self.__traced():
+                    try:
+                        print(self.run_task(self.args.job, self.args.task))
+                    except Exception as e:
+                        self.__print_error(e)
+                        sys.exit(1)
+            else:
+                with self.__traced():
+                    try:
+                        print(self.run())
+                    except Exception as e:
+                        self.__print_error(e)
+                        sys.exit(1)
+        finally:
+            # e.g. keep-alive connections to vault
+            if hasattr(self.secret_manager, "close"):
+                self.secret_manager.close()
+
+    @contextmanager
+    def __traced(self):
+        if not self.args.trace:
+            yield
+            return
+        trace.start()
+        try:
+            with trace.span(self.name, "pipeline"):
+                yield
+        finally:
+            trace.stop(self.args.trace)
+            print(f"Trace written to {self.args.trace}", file=sys.stderr)
 
     def __print_error(self, e: Exception):
         frames = inspect.getinnerframes(e.__traceback__)
@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import mmap
+import pickle
+from contextlib import contextmanager
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class ResultCodec:
+    """
+    Serialization of task results, which are passed to subsequent tasks of a job in CACHE_DIR
+    """
+
+    def __init__(self, name, extension, dump, load):
+        self.name = name
+        self.extension = extension
+        self.dump = dump
+        self.load = load
+
+
+@contextmanager
+def mapped(path):
+    """
+    Memory maps the file at `path`, large results are decoded without reading them into a copy in memory first
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def json_dump(result, path):
+    with open(path, "w") as f:
+        json.dump(result, f)
+
+
+def json_load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# results are only read by tasks of the same pipeline, which wrote them, so unpickling them is safe
+
+
+def pickle_dump(result, path):
+    with open(path, "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def pickle_load(path):
+    with mapped(path) as data:
+        return pickle.loads(data)
+
+
+def msgpack_dump(result, path):
+    with open(path, "wb") as f:
+        f.write(msgpack.packb(result, use_bin_type=True))
+
+
+def msgpack_load(path):
+    with mapped(path) as data:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def msgpack_available():
+    return msgpack is not None
+
+
+RESULT_CODECS = {
+    "json": ResultCodec("json", ".json", json_dump, json_load),
+    # supports bytes, tuples, sets and arbitrary python objects
+    "pickle": ResultCodec("pickle", ".pickle", pickle_dump, pickle_load),
+    # compact and language independent, requires the msgpack module
+    "msgpack": ResultCodec("msgpack", ".msgpack", msgpack_dump, msgpack_load),
+}
+
+
+def get_result_codec(name) -> ResultCodec:
+    if isinstance(name, ResultCodec):
+        return name
+    if name not in RESULT_CODECS:
+        raise Exception(f"Unknown result codec {name}. List of available codecs: " + " ".join(RESULT_CODECS.keys()))
+    if name == "msgpack" and not msgpack_available():
+        print("Warning: the msgpack module is not available, falling back to pickle", file=sys.stderr)
+        name = "pickle"
+    return RESULT_CODECS[name]
@@ -0,0 +1,145 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+
+from pipeline_dsl import output
+from .job import GetStep, ParallelStep
+
+
+def dependencies(job, known):
+    steps = []
+    for step in job.plan:
+        if isinstance(step, ParallelStep):
+            steps.extend(step.tasks)
+        else:
+            steps.append(step)
+    # jobs which are not part of the pipeline can't be waited for
+    return set(name for step in steps if isinstance(step, GetStep) for name in step.passed if name in known and name != job.name)
+
+
+def start(fn, job):
+    """
+    Runs `fn(job)` in a new daemon thread. Unlike the threads of a ThreadPoolExecutor they aren't joined when the
+    interpreter exits, so an interrupted run doesn't wait for the running tasks.
+    """
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(fn, job))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f"job-{job.name}", daemon=True).start()
+    return future
+
+
+def locks(job):
+    result = set(f"group:{group}" for group in job.serial_groups)
+    if job.serial:
+        result.add(f"job:{job.name}")
+    return result
+
+
+class JobScheduler:
+    """
+    Runs the jobs of a pipeline locally in threads (in the main thread if `max_workers` is 1). A job is started as soon as all jobs it depends on
+    via `passed` are finished and none of its serial groups is held by a running job.
+    """
+
+    def __init__(self, jobs, max_workers=1):
+        self.jobs = jobs
+        self.max_workers = max(1, max_workers)
+        known = set(job.name for job in jobs)
+        self.dependencies = dict((job.name, dependencies(job, known)) for job in jobs)
+        self.durations = {}
+        # set on failures and interrupts, running jobs don't start further tasks
+        self.aborted = threading.Event()
+
+    def __timed(self, run_job, job):
+        start = time.perf_counter()
+        try:
+            return run_job(job)
+        finally:
+            self.durations[job.name] = time.perf_counter() - start
+
+    def __ready(self, pending, done):
+        return [job for job in pending if self.dependencies[job.name] <= done]
+
+    def run(self, run_job):
+        if self.max_workers == 1:
+            self.__run_inline(run_job)
+        else:
+            self.__run_threaded(run_job)
+
+    def __run_inline(self, run_job):
+        # in the main thread, a KeyboardInterrupt stops the running task right away
+        pending = list(self.jobs)
+        done = set()
+        while pending:
+            ready = self.__ready(pending, done)
+            if not ready:
+                raise Exception("Cyclic passed constraints between jobs: " + " ".join(job.name for job in pending))
+            pending.remove(ready[0])
+            self.__timed(run_job, ready[0])
+            done.add(ready[0].name)
+
+    def __run_threaded(self, run_job):
+        pending = list(self.jobs)
+        running = {}
+        held = set()
+        done = set()
+        error = None
+
+        def run_captured(job):
+            with output.captured():
+                return self.__timed(run_job, job)
+
+        try:
+            with output.routed():
+                while pending or running:
+                    if not error:
+                        for job in self.__ready(pending, done):
+                            if len(running) >= self.max_workers:
+                                break
+                            if not locks(job) & held:
+                                pending.remove(job)
+                                held |= locks(job)
+                                running[start(run_captured, job)] = job
+                    if not running:
+                        if pending and not error:
+                            raise Exception("Cyclic passed constraints between jobs: " + " ".join(job.name for job in pending))
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        job = running.pop(future)
+                        held -= locks(job)
+                        if future.exception():
+                            error = error or future.exception()
+                        else:
+                            done.add(job.name)
+        except BaseException:
+            # e.g. KeyboardInterrupt, running jobs don't start further tasks and aren't waited for
+            self.aborted.set()
+            raise
+        if error:
+            raise error
+
+    def critical_path(self):
+        longest = {}
+
+        def visit(name):
+            if name not in longest:
+                upstream = [visit(dep) for dep in self.dependencies[name] if dep in self.durations]
+                duration, path = max(upstream, default=(0, []))
+                longest[name] = (duration + self.durations[name], path + [name])
+            return longest[name]
+
+        return max((visit(name) for name in self.durations), default=(0, []))
+
+    def report(self):
+        duration, path = self.critical_path()
+        if path:
+            print(f"Critical path ({duration:.1f}s): " + " -> ".join(f"{name} ({self.durations[name]:.1f}s)" for name in path))
@@ -0,0 +1,111 @@
+import os
+import ssl
+import json
+import time
+import threading
+import http.client
+from urllib.parse import quote, urlsplit
+
+
+class VaultSecretManager:
+    """
+    Reads secrets from the Vault HTTP API (same paths as `vault read -field=value <key>`).
+    Connections are kept alive per thread and values are cached for the lifetime of the process or `ttl` seconds.
+    """
+
+    def __init__(self, address=None, token=None, ttl=None, field="value", timeout=30):
+        self.address = address or os.getenv("VAULT_ADDR", "https://127.0.0.1:8200")
+        self.token = token
+        self.ttl = ttl
+        self.field = field
+        self.timeout = timeout
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # connections of all threads, to close them at the end of the run
+        self.connections = set()
+
+    def __token(self):
+        if not self.token:
+            self.token = os.getenv("VAULT_TOKEN")
+        if not self.token:
+            try:
+                with open(os.path.join(os.path.expanduser("~"), ".vault-token")) as f:
+                    self.token = f.read().strip()
+            except FileNotFoundError:
+                raise Exception("No vault token available. Run `vault login` or set VAULT_TOKEN") from None
+        return self.token
+
+    def __connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            url = urlsplit(self.address)
+            if url.scheme == "https":
+                context = ssl.create_default_context(cafile=os.getenv("VAULT_CACERT"))
+                connection = http.client.HTTPSConnection(url.netloc, timeout=self.timeout, context=context)
+            else:
+                connection = http.client.HTTPConnection(url.netloc, timeout=self.timeout)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.add(connection)
+        return connection
+
+    def __request(self, key):
+        path = "/v1/" + quote(key.lstrip("/"))
+        headers = {"X-Vault-Token": self.__token()}
+        if os.getenv("VAULT_NAMESPACE"):
+            headers["X-Vault-Namespace"] = os.getenv("VAULT_NAMESPACE")
+        for attempt in range(2):
+            connection = self.__connection()
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # the server may close idle keep-alive connections, retry once on a new one
+                connection.close()
+                self.local.connection = None
+                with self.lock:
+                    self.connections.discard(connection)
+                if attempt:
+                    raise
+
+    def __read(self, key):
+        status, body = self.__request(key)
+        if status == 404:
+            return None
+        if status != 200:
+            raise Exception(f"Reading secret {key} from vault failed with status {status}: {body.decode('utf-8', 'replace')}")
+        data = json.loads(body).get("data") or {}
+        # kv version 2 nests the secret data
+        if self.field not in data and isinstance(data.get("data"), dict):
+            data = data["data"]
+        value = data.get(self.field)
+        return None if value is None else str(value)
+
+    def __cached(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+        if entry and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+            return entry
+        return None
+
+    def prefetch(self, keys):
+        for key in keys:
+            self(key)
+
+    def __call__(self, key):
+        entry = self.__cached(key)
+        if entry:
+            return entry[0]
+        value = self.__read(key)
+        with self.lock:
+            self.cache[key] = (value, time.monotonic())
+        return value
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, set()
+            self.local = threading.local()
+        for connection in connections:
+            connection.close()
@@ -1,24 +1,86 @@
 import os
-import json
-import base64
-import tarfile
-import io
+import time
+import types
+import shutil
+import hashlib
+import contextvars
+from contextlib import nullcontext
 
+from pipeline_dsl import stats, trace
 from .__shared import CACHE_DIR, SCRIPT_DIR, concourse_context
+from .bundle import BundleCache
+from .paths import PathFilter
+from .results import get_result_codec
+from .watchdog import Watchdog
 
 STARTER_DIR = "starter"
 PYTHON_DIR = "pythonpath"
+RETRY_BACKOFF = 1
+RETRY_BACKOFF_MAX = 60
+
+# (name, dependencies) of the memoized task whose body is running, results of other tasks would not be part of its key
+_memoized = contextvars.ContextVar("pipeline_dsl_memoized", default=None)
+
+
+def referenced_tasks(fun):
+    """Tasks whose results `fun` reads through their decorated function, as a global or a captured variable"""
+    values = []
+    for cell in fun.__closure__ or []:
+        try:
+            values.append(cell.cell_contents)
+        except ValueError:
+            pass
+    codes = [fun.__code__]
+    while codes:
+        code = codes.pop()
+        values.extend(fun.__globals__[name] for name in code.co_names if name in fun.__globals__)
+        codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+    tasks = []
+    for value in values:
+        task = getattr(value, "task", None)
+        if isinstance(task, Task) and task not in tasks:
+            tasks.append(task)
+    return tasks
 
 
 class Task:
-    def __init__(self, fun, jobname, secret_manager, image_resource, script, inputs=[], timeout="5m", privileged=False, outputs=[], secrets={}, attempts=1, caches=[], name=None, env={}):
+    def __init__(
+        self,
+        fun,
+        jobname,
+        secret_manager,
+        image_resource,
+        script,
+        inputs=[],
+        timeout="5m",
+        privileged=False,
+        outputs=[],
+        secrets={},
+        attempts=1,
+        caches=[],
+        name=None,
+        env={},
+        memoize=False,
+        memo=None,
+        input_versions=None,
+        paths=None,
+        ignore_paths=None,
+        changed_files=None,
+        local_caches=None,
+        result_codec="json",
+    ):
         if not name:
             name = fun.__name__.replace("_", "-")
         self.name = name
+        self.jobname = jobname
+        self.memoize = memoize
+        self.memo = memo
+        self.path_filter = PathFilter(paths, ignore_paths) if paths or ignore_paths else None
         self.timeout = timeout
         self.privileged = privileged
         self.attempts = attempts
         self.caches = caches
+        self.local_caches = local_caches
         self.secret_manager = secret_manager
         self.config = {
             "platform": "linux",
@@ -39,15 +101,67 @@ class Task:
                 "args": [os.path.join(SCRIPT_DIR, STARTER_DIR, os.path.basename(script)), "--job", jobname, "--task", name, "--concourse"],
             },
         }
-        cache_file = os.path.join(CACHE_DIR, jobname, name + ".json")
+        self.result_codec = get_result_codec(result_codec)
+        # absolute, results must be found regardless of the working directory the task is started in
+        cache_file = os.path.abspath(os.path.join(CACHE_DIR, jobname, name + self.result_codec.extension))
+        stats_file = os.path.abspath(os.path.join(CACHE_DIR, jobname, name + ".stats.json"))
+
+        def store(result):
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            self.result_codec.dump(result, cache_file)
+
+        def mounted_caches():
+            if self.local_caches and self.caches and not concourse_context():
+                return self.local_caches.mounted(jobname, name, self.caches)
+            return nullcontext()
+
+        def watched():
+            # concourse enforces timeout and attempts itself
+            if self.timeout and not concourse_context():
+                return Watchdog(name, self.timeout)
+            return nullcontext()
+
+        def execute(kwargs, output_dirs, task_stats):
+            attempts = 1 if concourse_context() else max(self.attempts, 1)
+            for attempt in range(1, attempts + 1):
+                start = time.perf_counter()
+                try:
+                    with mounted_caches(), watched():
+                        result = fun(**kwargs)
+                except Exception as e:
+                    seconds = time.perf_counter() - start
+                    task_stats.record_attempt(seconds, "failed")
+                    if attempt == attempts:
+                        raise
+                    delay = min(RETRY_BACKOFF * 2 ** (attempt - 1), RETRY_BACKOFF_MAX)
+                    print(f"Attempt {attempt}/{attempts} of {name} failed after {seconds:.1f}s: {e}, retrying in {delay:.0f}s")
+                    time.sleep(delay)
+                    # like on concourse, every attempt starts with empty outputs
+                    for dir in output_dirs.values():
+                        shutil.rmtree(dir, ignore_errors=True)
+                        os.makedirs(dir)
+                else:
+                    seconds = time.perf_counter() - start
+                    task_stats.record_attempt(seconds, "ok")
+                    if attempts > 1:
+                        print(f"Attempt {attempt}/{attempts} of {name} succeeded after {seconds:.1f}s")
+                    return result
 
         def fn():
+            task_stats = stats.TaskStats(jobname, name)
+            try:
+                with trace.span(name, "task", job=jobname), task_stats.measure():
+                    return run(task_stats)
+            except BaseException:
+                task_stats.status = "failed"
+                raise
+            finally:
+                task_stats.write(stats_file)
+
+        def run(task_stats):
             print(f"Running: {name}")
             kwargs = {}
-            for kv in secrets.items():
-                kwargs[kv[0]] = self.secret_manager(str(kv[1]))
-                if not kwargs[kv[0]] and not isinstance(kv[1], OptionalSecret):
-                    raise Exception(f'Secret not available as environment variable "{kv[1]}"')
+            output_dirs = {}
             for out in outputs:
                 dir = out
                 if not concourse_context():
@@ -55,25 +169,71 @@ class Task:
                 else:
                     dir = os.path.abspath(out)
                 os.makedirs(dir, exist_ok=True)
-                kwargs[out] = dir
-            result = fun(**kwargs)
-            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
-            with open(cache_file, "w") as fd:
-                json.dump(result, fd)
+                output_dirs[out] = dir
+            if self.path_filter and changed_files:
+                changes = changed_files()
+                # without information about the changes (e.g. locally) the task runs
+                if changes is not None and not self.path_filter.affected(changes):
+                    print(f"Skipping {name}: none of the changed files matches its paths")
+                    task_stats.status = "skipped"
+                    store(None)
+                    return None
+            memo_key = None
+            if self.memoize and self.memo and not concourse_context():
+                versions = input_versions() if input_versions else {}
+                dependencies = [task for task in referenced_tasks(fun) if task is not self]
+                results = dict((f"{task.jobname}/{task.name}", task.result_digest()) for task in dependencies)
+                memo_key = self.memo.key(jobname, name, fun, dict((k, v) for k, v in versions.items() if k not in outputs), results)
+                hit = self.memo.load(jobname, name, memo_key, output_dirs)
+                if hit:
+                    print(f"Inputs of {name} unchanged, using cached result")
+                    task_stats.status = "cached"
+                    store(hit.result)
+                    return hit.result
+            if secrets and hasattr(self.secret_manager, "prefetch"):
+                with trace.span("prefetch secrets", "secret", keys=len(secrets)):
+                    self.secret_manager.prefetch([str(secret) for secret in secrets.values()])
+            for kv in secrets.items():
+                with trace.span("secret", "secret", key=str(kv[1])):
+                    kwargs[kv[0]] = self.secret_manager(str(kv[1]))
+                if not kwargs[kv[0]] and not isinstance(kv[1], OptionalSecret):
+                    raise Exception(f'Secret not available as environment variable "{kv[1]}"')
+            kwargs.update(output_dirs)
+            token = _memoized.set((name, dependencies) if memo_key else None)
+            try:
+                result = execute(kwargs, output_dirs, task_stats)
+            finally:
+                _memoized.reset(token)
+            store(result)
+            if memo_key:
+                self.memo.store(jobname, name, memo_key, result, output_dirs, self.result_codec)
             return result
 
         def fn_cached():
+            memoized = _memoized.get()
+            if memoized and self not in memoized[1]:
+                raise Exception(f"Memoized task {memoized[0]} uses the result of {name}, reference {name} by name in the task so its result is part of the memo key")
             try:
-                with open(cache_file, "r") as fd:
-                    return json.load(fd)
+                return self.result_codec.load(cache_file)
             except FileNotFoundError:
                 try:
                     return fn()
                 except Exception as exc:
                     raise exc from None
 
+        def result_digest():
+            fn_cached()
+            with open(cache_file, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+
+        fn_cached.task = self
         self.fn = fn
-        self.fn_cached = fn  # fn_cached
+        self.fn_cached = fn_cached
+        self.result_digest = result_digest
+
+    def invalidate(self):
+        if self.memo:
+            self.memo.invalidate(self.jobname, self.name)
 
     def concourse(self):
         concourse = {
@@ -89,32 +249,18 @@ class Task:
 
 
 class InitTask:
-    def __init__(self, init_dirs, image_resource):
+    def __init__(self, init_dirs, image_resource, bundle_cache=None, bundle_store=None):
         self.init_dirs = init_dirs
         self.image_resource = image_resource
+        self.bundle_cache = bundle_cache if bundle_cache is not None else BundleCache()
+        self.bundle_store = bundle_store
 
     def package(self):
-        buffer = io.BytesIO()
-        tar = tarfile.open(fileobj=buffer, mode="x:bz2")
-        init_dirs = sorted(list(self.init_dirs.items()), key=lambda d: len(d[1]), reverse=True)
-
-        def filter(tarinfo):
-            if not (tarinfo.isdir() or tarinfo.name.endswith(".sh") or tarinfo.name.endswith(".py")):
-                return None
-            tarinfo.uid = 0
-            tarinfo.gid = 0
-            tarinfo.uname = "root"
-            tarinfo.gname = "root"
-            tarinfo.mtime = 0
-            return tarinfo
-
-        for dir_concourse, dir_local in init_dirs:
-            dir_local = os.path.abspath(dir_local)
-            tar.add(dir_local, arcname=dir_concourse, filter=filter)
-        tar.close()
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+        return self.bundle_cache.package(self.init_dirs)
 
     def concourse(self):
+        if self.bundle_store:
+            return self.__fetch()
         return {
             "task": "init",
             "config": {
@@ -125,12 +271,37 @@ class InitTask:
                     "path": "/bin/bash",
                     "args": [
                         "-ceu",
-                        f'echo "{self.package()}" | base64 -d | tar -C {SCRIPT_DIR} -xvjf -',
+                        f'echo "{self.package()}" | base64 -d | {self.bundle_cache.codec.extract_cmd(SCRIPT_DIR)}',
                     ],
                 },
             },
         }
 
+    def __fetch(self):
+        key = self.bundle_store.key(self.bundle_cache.bundle(self.init_dirs), self.bundle_cache.codec)
+        name = self.bundle_store.name
+        return {
+            "do": [
+                {"get": name, "trigger": False},
+                {
+                    "task": "init",
+                    "config": {
+                        "platform": "linux",
+                        "image_resource": self.image_resource,
+                        "inputs": [{"name": name}],
+                        "outputs": [{"name": CACHE_DIR}, {"name": SCRIPT_DIR}],
+                        "run": {
+                            "path": "/bin/bash",
+                            "args": [
+                                "-ceu",
+                                f"cat {name}/{os.path.basename(key)} | {self.bundle_cache.codec.extract_cmd(SCRIPT_DIR)}",
+                            ],
+                        },
+                    },
+                },
+            ]
+        }
+
 
 class OptionalSecret:
     def __init__(self, name):
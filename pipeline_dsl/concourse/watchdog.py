@@ -0,0 +1,140 @@
+import os
+import re
+import glob
+import time
+import signal
+import threading
+import contextvars
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("pipeline_dsl_watchdog", default=None)
+
+DURATION_UNITS = {
+    "ns": 1e-9,
+    "us": 1e-6,
+    "µs": 1e-6,
+    "μs": 1e-6,
+    "ms": 1e-3,
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+}
+DURATION_PART = re.compile(r"(\d+\.?\d*|\.\d+)(ns|us|µs|μs|ms|s|m|h)")
+
+
+def parse_duration(value):
+    """
+    Parses a duration like concourse does (go's time.ParseDuration, e.g. `90s`, `1h30m` or `1.5h`) into seconds
+    """
+    text = str(value).strip()
+    sign = -1 if text.startswith("-") else 1
+    text = text.lstrip("+-")
+    if text == "0":
+        return 0.0
+    if not text:
+        raise Exception(f"Invalid duration {value!r}, expected e.g. 90s, 5m or 1h30m")
+    seconds = 0.0
+    pos = 0
+    while pos < len(text):
+        match = DURATION_PART.match(text, pos)
+        if not match:
+            raise Exception(f"Invalid duration {value!r}, expected e.g. 90s, 5m or 1h30m")
+        seconds += float(match.group(1)) * DURATION_UNITS[match.group(2)]
+        pos = match.end()
+    return sign * seconds
+
+
+def current():
+    return _current.get()
+
+
+def process_tree(pids):
+    """
+    `pids` and all their descendants, read from /proc/<pid>/task/*/children. Subprocesses stay in the process group
+    of the pipeline, so Ctrl-C reaches them and they can prompt on the terminal, their tree is killed instead of a group.
+    """
+    tree = []
+    pending = list(pids)
+    while pending:
+        pid = pending.pop()
+        if pid in tree:
+            continue
+        tree.append(pid)
+        for children in glob.glob(f"/proc/{pid}/task/*/children"):
+            try:
+                with open(children) as f:
+                    pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    return tree
+
+
+def kill_tree(pids, sig):
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class Watchdog:
+    """
+    Enforces the timeout of a local task. Subprocesses started by `shell` while the watchdog is active are terminated
+    together with their descendants (and killed after `grace` seconds) once the timeout expires. Python code of
+    the task can't be interrupted, the timeout is raised as soon as it returns.
+    """
+
+    def __init__(self, name, timeout, grace=5):
+        self.name = name
+        self.timeout = timeout
+        self.seconds = parse_duration(timeout)
+        self.grace = grace
+        self.expired = False
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.timer = None
+        self.token = None
+
+    def __enter__(self):
+        self.timer = threading.Timer(self.seconds, self.expire)
+        self.timer.daemon = True
+        self.timer.start()
+        self.token = _current.set(self)
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.timer.cancel()
+        _current.reset(self.token)
+        if self.expired:
+            raise TimeoutError(f"Task {self.name} timed out after {self.timeout}") from value
+
+    def expire(self):
+        with self.lock:
+            self.expired = True
+            tree = process_tree(process.pid for process in self.processes)
+        kill_tree(tree, signal.SIGTERM)
+        if tree:
+            time.sleep(self.grace)
+            # descendants are reparented once their parent terminated, they are only found by their recorded pids
+            kill_tree(process_tree(tree), signal.SIGKILL)
+
+    def check(self):
+        if self.expired:
+            raise TimeoutError(f"Task {self.name} timed out after {self.timeout}")
+
+    @contextmanager
+    def watching(self, process):
+        with self.lock:
+            expired = self.expired
+            self.processes.add(process)
+        if expired:
+            kill_tree(process_tree([process.pid]), signal.SIGKILL)
+        try:
+            yield process
+        except BaseException:
+            # e.g. KeyboardInterrupt, descendants of the process would survive otherwise
+            kill_tree(process_tree([process.pid]), signal.SIGKILL)
+            raise
+        finally:
+            with self.lock:
+                self.processes.discard(process)
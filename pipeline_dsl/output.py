@@ -0,0 +1,70 @@
+import io
+import sys
+import threading
+import contextvars
+from contextlib import contextmanager
+
+_buffer = contextvars.ContextVar("pipeline_dsl_output", default=None)
+_lock = threading.Lock()
+_routed = 0
+_streams = None
+
+
+class OutputRouter:
+    """
+    Replaces sys.stdout/sys.stderr and redirects writes into the buffer of the current context (if any)
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = _buffer.get()
+        if buffer is not None:
+            return buffer.write(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        if _buffer.get() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def capturing():
+    return _buffer.get() is not None
+
+
+@contextmanager
+def routed():
+    global _routed, _streams
+    with _lock:
+        if _routed == 0:
+            _streams = (sys.stdout, sys.stderr)
+            sys.stdout = OutputRouter(sys.stdout)
+            sys.stderr = OutputRouter(sys.stderr)
+        _routed += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _routed -= 1
+            if _routed == 0:
+                sys.stdout, sys.stderr = _streams
+
+
+@contextmanager
+def captured():
+    """
+    Collects all output of the current context and writes it in one piece when leaving the block
+    """
+    buffer = io.StringIO()
+    token = _buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(token)
+        with _lock:
+            sys.stdout.write(buffer.getvalue())
+            sys.stdout.flush()
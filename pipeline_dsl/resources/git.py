@@ -4,6 +4,71 @@ from typing import Optional, Dict
 import os
 
 
+def git_dirs(path):
+    """
+    Returns the git directory of the repository in `path` and the common directory holding refs and packed-refs
+    (they differ for linked worktrees)
+    """
+    dir = os.path.join(path, ".git")
+    if os.path.isfile(dir):
+        with open(dir) as f:
+            content = f.read().strip()
+        if not content.startswith("gitdir:"):
+            return None, None
+        dir = os.path.join(path, content[len("gitdir:") :].strip())
+    common = dir
+    try:
+        with open(os.path.join(dir, "commondir")) as f:
+            common = os.path.join(dir, f.read().strip())
+    except FileNotFoundError:
+        pass
+    return dir, common
+
+
+def packed_ref(common_dir, name):
+    try:
+        with open(os.path.join(common_dir, "packed-refs")) as f:
+            for line in f:
+                if line.startswith("#") or line.startswith("^"):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == name:
+                    return parts[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def resolve_head(path):
+    """
+    Resolves HEAD of the repository in `path` by reading HEAD, loose refs and packed-refs.
+    Returns None if that's not possible (e.g. an unborn branch or an unknown ref storage), the git cli has to be used then.
+    """
+    dir, common = git_dirs(path)
+    if not dir:
+        return None
+    name = "HEAD"
+    # symbolic refs may point to other symbolic refs, git gives up after 5 levels as well
+    for _ in range(5):
+        value = None
+        for base in [dir, common] if name == "HEAD" or not name.startswith("refs/") else [common]:
+            try:
+                with open(os.path.join(base, name)) as f:
+                    value = f.read().strip()
+                break
+            except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+                pass
+        if value is None:
+            value = packed_ref(common, name)
+        if value is None:
+            return None
+        if value.startswith("ref:"):
+            name = value[len("ref:") :].strip()
+            continue
+        return value if len(value) in (40, 64) else None
+    return None
+
+
 class GitRepoResource:
     def __init__(self, name: str, uri: str, config: dict) -> None:
         self.name = name
@@ -13,6 +78,7 @@ class GitRepoResource:
             self.path = os.path.abspath(self.name)
         else:
             self.path = os.getenv("HOME", "") + "/workspace/" + os.path.splitext(os.path.basename(uri))[0]
+        self.cache = {}
 
     def __str__(self) -> str:
         return self.path
@@ -20,9 +86,52 @@ class GitRepoResource:
     def directory(self) -> str:
         return self.path
 
+    def head(self) -> str:
+        head = resolve_head(self.path)
+        if head:
+            return head
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=self.path).decode("utf-8").strip()
+
+    def __tags_state(self):
+        _, common = git_dirs(self.path)
+        if not common:
+            return ()
+        state = []
+        try:
+            state.append(os.stat(os.path.join(common, "packed-refs")).st_mtime_ns)
+        except OSError:
+            state.append(None)
+        # tags like release/1.0 are stored in subdirectories, which don't change the mtime of refs/tags
+        for dirpath, dirnames, filenames in os.walk(os.path.join(common, "refs", "tags")):
+            dirnames.sort()
+            for path in [dirpath] + [os.path.join(dirpath, name) for name in sorted(filenames)]:
+                try:
+                    state.append((path, os.stat(path).st_mtime_ns))
+                except OSError:
+                    state.append((path, None))
+        return tuple(state)
+
+    def __memoized(self, query, fn, state=()):
+        # results are only valid for the current HEAD (and the state of the tags for describe)
+        state = (self.head(),) + state
+        entry = self.cache.get(query)
+        if not entry or entry[0] != state:
+            try:
+                entry = (state, fn(), None)
+            except Exception as e:
+                entry = (state, None, e)
+            self.cache[query] = entry
+        if entry[2]:
+            raise entry[2]
+        return entry[1]
+
     # Always returns the newest tag for the current version
     def tag(self) -> str:
-        return subprocess.check_output(["git", "describe", "--tags"], cwd=self.path, stderr=subprocess.DEVNULL).decode("utf-8").strip()
+        return self.__memoized(
+            "describe",
+            lambda: subprocess.check_output(["git", "describe", "--tags"], cwd=self.path, stderr=subprocess.DEVNULL).decode("utf-8").strip(),
+            self.__tags_state(),
+        )
 
     # Returns one tag for the current version
     def ref(self) -> str:
@@ -32,13 +141,14 @@ class GitRepoResource:
         try:
             return self.tag()
         except Exception:
-            return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=self.path).decode("utf-8").strip()
+            return self.head()
 
     def short_ref(self) -> str:
         if concourse_context():
             with open(os.path.join(self.path, ".git/short_ref")) as f:
                 return f.read().strip()
-        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=self.path).decode("utf-8").strip()
+        # the length of an unambiguous abbreviation depends on the object database
+        return self.__memoized("short", lambda: subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=self.path).decode("utf-8").strip())
 
 
 class GitRepo(AbstractResource[GitRepoResource]):
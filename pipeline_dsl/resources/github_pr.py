@@ -1,33 +1,65 @@
 from pipeline_dsl.resources.resource import AbstractResource, ConcourseResource
 from pipeline_dsl.concourse import concourse_context
-from typing import Optional, Union, Dict, List
+from typing import Optional, Union, Dict, List, Iterable, Iterator
+import fnmatch
 import json
 import os
+import re
 
 
 class GithubPRResource:
     def __init__(self, name: str) -> None:
         self.name = name
         self.path = os.path.abspath(self.name)
+        self.cache = {}
 
     def __str__(self) -> str:
         return self.name
 
+    def __file(self, name: str) -> str:
+        return os.path.join(self.path, ".git", "resource", name)
+
+    def __load(self, name: str):
+        # the files of a fetched version don't change during a task
+        if name not in self.cache:
+            with open(self.__file(name)) as f:
+                self.cache[name] = json.load(f)
+        return self.cache[name]
+
     def version(self, default: str = None) -> Optional[str]:
         if concourse_context():
-            return json.load(open(os.path.join(self.path, ".git", "resource", "version.json")))
+            return self.__load("version.json")
         return default
 
     def metadata(self, default: str = None) -> Optional[str]:
         if concourse_context():
-            return json.load(open(os.path.join(self.path, ".git", "resource", "metadata.json")))
+            return self.__load("metadata.json")
         return default
 
+    def iter_changed_files(self, prefix: str = None, pattern: str = None, default: Iterable[str] = ()) -> Iterator[str]:
+        """
+        Yields the changed files starting with `prefix` and matching the glob `pattern` (both optional)
+        without reading the whole list into memory
+        """
+        match = re.compile(fnmatch.translate(pattern)).match if pattern else None
+        if concourse_context():
+            f = open(self.__file("changed_files"))
+            lines = (line.strip() for line in f)
+        else:
+            f = None
+            lines = iter(default)
+        try:
+            for line in lines:
+                if not line or (prefix and not line.startswith(prefix)) or (match and not match(line)):
+                    continue
+                yield line
+        finally:
+            if f:
+                f.close()
+
     def changed_files(self, default: str = None) -> Union[List[str], Optional[str]]:
         if concourse_context():
-            with open(os.path.join(self.path, ".git", "resource", "changed_files")) as f:
-                lines = f.readlines()
-                return [line.strip() for line in lines]
+            return list(self.iter_changed_files())
         return default
 
 
@@ -1,4 +1,24 @@
+import os
+import sys
+import time
+import asyncio
+import select
+import functools
+import selectors
+import threading
 import subprocess
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+
+from pipeline_dsl import output, stats, trace
+from pipeline_dsl.concourse import watchdog
+
+CHUNK_SIZE = 64 * 1024
+PIPE_BUF = getattr(select, "PIPE_BUF", 512)
+# before python 3.8 asyncio can only start subprocesses from the main thread, e.g. not in tasks of `in_parallel`
+THREADED_CHILD_WATCHER = sys.version_info >= (3, 8)
 
 
 class Password:
@@ -9,12 +29,321 @@ class Password:
         return self.password
 
 
-def shell(cmd, check=True, cwd=None, capture_output=False, input=None):
+class LineSplitter:
+    """
+    Splits chunks of output into decoded lines, a line may span several chunks
+    """
+
+    def __init__(self):
+        self.rest = b""
+
+    def feed(self, data):
+        lines = (self.rest + data).split(b"\n")
+        self.rest = lines.pop()
+        return [line.decode("utf-8", "replace") + "\n" for line in lines]
+
+    def flush(self):
+        rest, self.rest = self.rest, b""
+        return [rest.decode("utf-8", "replace")] if rest else []
+
+
+class LineSink:
+    """
+    Distributes output lines to sys.stdout/sys.stderr (if `echo` is set), the callback `on_line`, the file `tee`
+    (a path or a file object) and a ring buffer of the last `tail` lines
+    """
+
+    def __init__(self, on_line=None, tee=None, tail=None, echo=True):
+        self.on_line = on_line
+        self.file = open(tee, "w") if isinstance(tee, (str, os.PathLike)) else tee
+        self.owns_file = self.file is not tee
+        self.tail = deque(maxlen=tail) if tail else None
+        self.echo = echo
+
+    def __call__(self, line, stderr=False):
+        if self.echo:
+            (sys.stderr if stderr else sys.stdout).write(line)
+        if self.file:
+            self.file.write(line)
+        if self.tail is not None:
+            self.tail.append(line)
+        if self.on_line:
+            self.on_line(line)
+
+    def output(self):
+        return "".join(self.tail) if self.tail is not None else None
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+
+def shell(cmd, check=True, cwd=None, capture_output=False, input=None, on_line=None, tee=None, tail=None):
+    """
+    Runs `cmd`. Output is passed through, unless `capture_output` is set. With `on_line`, `tee` or `tail` the output is
+    streamed line by line to these sinks instead of being buffered, `stdout` of the result holds the last `tail` lines.
+    """
+    command = _format(cmd)
+    start = time.perf_counter()
+    try:
+        with trace.span("shell", "shell", cmd=command):
+            print(command)
+            if on_line or tee or tail or (output.capturing() and not capture_output):
+                # the output of the subprocess has to pass sys.stdout to end up in the captured output of the task
+                return _stream(_args(cmd), check, cwd, input, LineSink(on_line, tee, tail, echo=not capture_output))
+            return _run(_args(cmd), check, cwd, capture_output, input)
+    finally:
+        stats.record_subprocess(time.perf_counter() - start)
+
+
+def shell_lines(cmd, check=True, cwd=None, input=None):
+    """
+    Runs `cmd` and yields the lines of its output (stdout and stderr) as they arrive. The process is killed if the
+    generator is closed before the end of the output.
+    """
+    command = _format(cmd)
+    start = time.perf_counter()
+    try:
+        with trace.span("shell", "shell", cmd=command):
+            print(command)
+            args = _args(cmd)
+            with _spawn(args, cwd, input) as process:
+                for line, _ in _lines(process, input):
+                    yield line
+            if check and process.returncode:
+                raise subprocess.CalledProcessError(process.returncode, args)
+    finally:
+        stats.record_subprocess(time.perf_counter() - start)
+
+
+async def ashell(cmd, check=True, cwd=None, capture_output=False, input=None, on_line=None, tee=None, tail=None):
+    """
+    Like `shell`, but runs in an asyncio event loop, so several commands of one task can run concurrently:
+
+        async def build():
+            await asyncio.gather(ashell(["make", "a"]), ashell(["make", "b"]))
+
+        asyncio.run(build())
+
+    Before python 3.8 the command is run by `shell` in a thread of the default executor of the loop if the loop doesn't
+    run in the main thread.
+    """
+    if not THREADED_CHILD_WATCHER and threading.current_thread() is not threading.main_thread():
+        run = functools.partial(shell, cmd, check=check, cwd=cwd, capture_output=capture_output, input=input, on_line=on_line, tee=tee, tail=tail)
+        return await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, run)
+
+    command = _format(cmd)
+    start = time.perf_counter()
+    try:
+        with trace.span("shell", "shell", cmd=command):
+            print(command)
+            args = _args(cmd)
+            current = watchdog.current()
+            if current:
+                current.check()
+            pipe = asyncio.subprocess.PIPE
+            process = await asyncio.create_subprocess_exec(*args, cwd=cwd, stdin=None if input is None else pipe, stdout=pipe, stderr=pipe)
+            sink = None if capture_output and not (on_line or tee or tail) else LineSink(on_line, tee, tail, echo=not capture_output)
+            try:
+                with current.watching(process) if current else nullcontext():
+                    if sink:
+                        await asyncio.gather(_afeed(process.stdin, input), _aread(process.stdout, sink, False), _aread(process.stderr, sink, True))
+                        await process.wait()
+                        out, err = sink.output(), None
+                    else:
+                        out, err = await process.communicate(input)
+            except BaseException:
+                # e.g. cancelled by a failure of another command of the same gather
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+            finally:
+                if sink:
+                    sink.close()
+            result = subprocess.CompletedProcess(args, process.returncode, out, err)
+            if check and process.returncode:
+                raise subprocess.CalledProcessError(process.returncode, args, out, err)
+            return result
+    finally:
+        stats.record_subprocess(time.perf_counter() - start)
+
+
+class ShellPool:
+    """
+    Runs shell commands concurrently, at most `max_workers` (default: number of CPUs) at a time. The output of each
+    command is printed in one piece together with its duration once it finished. With `fail_fast` no further commands
+    are started after the first failure, otherwise all commands run. The failures are reported together when leaving
+    the block, with passwords redacted.
+    """
+
+    def __init__(self, max_workers=None, fail_fast=True):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.fail_fast = fail_fast
+        self.aborted = threading.Event()
+        self.commands = []
+        self.executor = None
+        self.stack = None
+
+    def __enter__(self):
+        self.stack = ExitStack()
+        self.stack.enter_context(output.routed())
+        self.executor = self.stack.enter_context(ThreadPoolExecutor(max_workers=self.max_workers))
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.stack.close()
+        if value is None:
+            self.__raise_failures()
+
+    def shell(self, cmd, **kwargs):
+        """
+        Schedules `cmd` (arguments like `shell`) and returns a future of its result, which is None if it was skipped
+        """
+        future = self.executor.submit(contextvars.copy_context().run, self.__run, cmd, kwargs)
+        self.commands.append((cmd, future))
+        return future
+
+    def __run(self, cmd, kwargs):
+        if self.aborted.is_set():
+            return None
+        with output.captured():
+            start = time.perf_counter()
+            try:
+                result = shell(cmd, **kwargs)
+            except Exception:
+                if self.fail_fast:
+                    self.aborted.set()
+                print(f"Failed after {time.perf_counter() - start:.1f}s: {_format(cmd)}")
+                raise
+            print(f"Finished after {time.perf_counter() - start:.1f}s: {_format(cmd)}")
+            return result
+
+    def __raise_failures(self):
+        failures = [(cmd, future.exception()) for cmd, future in self.commands if future.exception()]
+        if not failures:
+            return
+        # the message of CalledProcessError would contain passwords
+        reasons = [f"exit status {e.returncode}" if isinstance(e, subprocess.CalledProcessError) else str(e) for _, e in failures]
+        details = "".join(f"\n  {_format(cmd)}: {reason}" for (cmd, _), reason in zip(failures, reasons))
+        # not chained, the traceback would show the CalledProcessError including the passwords
+        raise Exception(f"{len(failures)} of {len(self.commands)} commands failed:{details}") from None
+
+
+def shell_many(cmds, max_workers=None, fail_fast=True, **kwargs):
+    """
+    Runs the commands `cmds` (arguments like `shell`) in a `ShellPool` and returns their results in the same order
+    """
+    with ShellPool(max_workers, fail_fast) as pool:
+        futures = [pool.shell(cmd, **kwargs) for cmd in cmds]
+    return [future.result() for future in futures]
+
+
+def _format(cmd):
+    return " ".join(list(map(lambda x: "<redacted>" if isinstance(x, Password) else str(x), cmd)))
+
+
+def _args(cmd):
+    return list(map(lambda x: str(x), cmd))
+
+
+def _run(args, check, cwd, capture_output, input):
     stdout = stderr = subprocess.PIPE if capture_output else None
+    current = watchdog.current()
+    if current is None:
+        return subprocess.run(args, check=check, cwd=cwd, stdout=stdout, stderr=stderr, input=input)
+    current.check()
+    with subprocess.Popen(args, cwd=cwd, stdin=None if input is None else subprocess.PIPE, stdout=stdout, stderr=stderr) as process:
+        with current.watching(process):
+            out, err = process.communicate(input)
+    result = subprocess.CompletedProcess(args, process.returncode, out, err)
+    if check:
+        result.check_returncode()
+    return result
+
+
+def _stream(args, check, cwd, input, sink):
+    try:
+        with _spawn(args, cwd, input) as process:
+            for line, stderr in _lines(process, input):
+                sink(line, stderr)
+    finally:
+        sink.close()
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, sink.output())
+    return subprocess.CompletedProcess(args, process.returncode, sink.output(), None)
+
+
+@contextmanager
+def _spawn(args, cwd, input):
+    current = watchdog.current()
+    if current:
+        current.check()
+    pipe = subprocess.PIPE
+    with subprocess.Popen(args, cwd=cwd, stdin=None if input is None else pipe, stdout=pipe, stderr=pipe) as process:
+        try:
+            with current.watching(process) if current else nullcontext():
+                yield process
+        except BaseException:
+            process.kill()
+            raise
+
+
+def _lines(process, input):
+    """
+    Yields (line, stderr) tuples of the output of `process` while writing `input` to it. Reading both pipes (and
+    writing stdin) through one selector avoids deadlocks when the process fills one pipe while we wait for another.
+    """
+    splitters = {process.stdout.fileno(): (LineSplitter(), False), process.stderr.fileno(): (LineSplitter(), True)}
+    stdin = process.stdin.fileno() if process.stdin else None
+    offset = 0
+    with selectors.DefaultSelector() as selector:
+        for fd in splitters:
+            selector.register(fd, selectors.EVENT_READ)
+        if stdin is not None:
+            view = memoryview(input)
+            selector.register(stdin, selectors.EVENT_WRITE)
+        while selector.get_map():
+            for key, _ in selector.select():
+                if key.fd == stdin:
+                    try:
+                        # writes of at most PIPE_BUF bytes to a writable pipe never block
+                        offset += os.write(stdin, view[offset : offset + PIPE_BUF])
+                    except BrokenPipeError:
+                        offset = len(view)
+                    if offset >= len(view):
+                        selector.unregister(stdin)
+                        process.stdin.close()
+                    continue
+                splitter, stderr = splitters[key.fd]
+                data = os.read(key.fd, CHUNK_SIZE)
+                if data:
+                    lines = splitter.feed(data)
+                else:
+                    selector.unregister(key.fd)
+                    lines = splitter.flush()
+                for line in lines:
+                    yield line, stderr
+    process.wait()
+
+
+async def _afeed(stdin, input):
+    if stdin is None:
+        return
+    try:
+        stdin.write(input)
+        await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        stdin.close()
+
 
-    print(
-        " ".join(
-            list(map(lambda x: "<redacted>" if isinstance(x, Password) else str(x), cmd)),
-        )
-    )
-    return subprocess.run(list(map(lambda x: str(x), cmd)), check=check, cwd=cwd, stdout=stdout, stderr=stderr, input=input)
+async def _aread(stream, sink, stderr):
+    splitter = LineSplitter()
+    while True:
+        data = await stream.read(CHUNK_SIZE)
+        for line in splitter.feed(data) if data else splitter.flush():
+            sink(line, stderr)
+        if not data:
+            return
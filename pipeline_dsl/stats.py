@@ -0,0 +1,102 @@
+import os
+import json
+import glob
+import time
+import contextvars
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("pipeline_dsl_stats", default=None)
+
+
+class TaskStats:
+    """
+    Resource usage of a single task run. CPU time of the task itself is measured per thread, so it is exact for tasks
+    running in parallel. Usage of subprocesses is taken from `os.times`, which is shared by all threads of the process.
+    The peak memory usage is only known for the whole process (see `peak_rss`), it isn't recorded per task.
+    """
+
+    def __init__(self, job, task):
+        self.job = job
+        self.task = task
+        self.status = "ok"
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.children_cpu_seconds = 0.0
+        self.subprocesses = 0
+        self.subprocess_seconds = 0.0
+        self.attempts = []
+
+    @contextmanager
+    def measure(self):
+        token = _current.set(self)
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        children = os.times()
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+            self.wall_seconds += time.perf_counter() - wall
+            self.cpu_seconds += time.thread_time() - cpu
+            after = os.times()
+            self.children_cpu_seconds += (after.children_user + after.children_system) - (children.children_user + children.children_system)
+
+    def record_subprocess(self, seconds):
+        self.subprocesses += 1
+        self.subprocess_seconds += seconds
+
+    def record_attempt(self, seconds, status):
+        self.attempts.append({"seconds": seconds, "status": status})
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(vars(self), f)
+
+
+def record_subprocess(seconds):
+    stats = _current.get()
+    if stats is not None:
+        stats.record_subprocess(seconds)
+
+
+def load(directory):
+    result = []
+    for path in sorted(glob.glob(os.path.join(directory, "*", "*.stats.json"))):
+        with open(path) as f:
+            result.append(json.load(f))
+    return result
+
+
+def summary(records):
+    header = ["job", "task", "status", "wall", "cpu", "children cpu", "subprocesses", "attempts"]
+    rows = [
+        [
+            r["job"],
+            r["task"],
+            r["status"],
+            f"{r['wall_seconds']:.1f}s",
+            f"{r['cpu_seconds']:.1f}s",
+            f"{r['children_cpu_seconds']:.1f}s",
+            str(r["subprocesses"]),
+            str(len(r.get("attempts", [])) or "-"),
+        ]
+        for r in records
+    ]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in [header] + rows]
+
+
+def peak_rss():
+    """
+    Peak resident set size of the process so far (VmHWM), None where /proc isn't available. `resource` isn't used, a
+    resource.py next to the pipeline definition would shadow it.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return f"Peak RSS: {int(line.split()[1]) // 1024}MiB (pipeline)"
+    except OSError:
+        pass
+    return None
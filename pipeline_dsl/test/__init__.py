@@ -0,0 +1,15 @@
+import os
+import tempfile
+from mock import patch
+
+
+def isolate_cache(test):
+    """
+    Points the local cache (bundles, task results, caches) of `test` to a temporary directory, which is removed again
+    after the test
+    """
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    env = patch.dict(os.environ, {"PIPELINE_DSL_CACHE_DIR": tmp.name})
+    env.start()
+    test.addCleanup(env.stop)
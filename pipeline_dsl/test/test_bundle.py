@@ -0,0 +1,143 @@
+import unittest
+from mock import patch
+
+from pipeline_dsl import Pipeline
+from pipeline_dsl.concourse.bundle import BundleCache, DirectoryBundleStore, CODECS, fingerprint
+from pipeline_dsl.concourse.ledger import FlyLedger
+from pipeline_dsl.test import isolate_cache
+import base64
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import yaml
+
+
+class TestBundleCache(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.scripts = os.path.join(self.tmp.name, "scripts")
+        os.makedirs(self.scripts)
+        with open(os.path.join(self.scripts, "test.sh"), "w") as f:
+            f.write("echo test\n")
+        with open(os.path.join(self.scripts, "ignored.txt"), "w") as f:
+            f.write("ignored\n")
+        self.cache_dir = os.path.join(self.tmp.name, "cache")
+        self.init_dirs = {"fake": self.scripts}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fingerprint(self):
+        before = fingerprint(self.init_dirs)
+        with open(os.path.join(self.scripts, "ignored.txt"), "w") as f:
+            f.write("still ignored\n")
+        self.assertEqual(before, fingerprint(self.init_dirs))
+        with open(os.path.join(self.scripts, "test.sh"), "w") as f:
+            f.write("echo changed\n")
+        self.assertNotEqual(before, fingerprint(self.init_dirs))
+
+    def test_compress_once(self):
+        with patch("pipeline_dsl.concourse.bundle.build", return_value=b"data") as build:
+            cache = BundleCache(self.cache_dir)
+            self.assertEqual(cache.package(self.init_dirs), cache.package(dict(self.init_dirs)))
+            self.assertEqual(build.call_count, 1)
+
+            # a new cache instance (i.e. the next invocation) reads the bundle from disk
+            bundle = BundleCache(self.cache_dir).bundle(self.init_dirs)
+            self.assertEqual(bundle.data, b"data")
+            self.assertEqual(build.call_count, 1)
+
+    def test_disabled_persistence(self):
+        BundleCache("").bundle(self.init_dirs)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_codecs(self):
+        for name, codec in CODECS.items():
+            if name == "zstd":
+                continue
+            with self.subTest(codec=name):
+                data = base64.b64decode(BundleCache("", codec=name).package(self.init_dirs))
+                with tempfile.TemporaryDirectory() as target:
+                    subprocess.run(["bash", "-c", codec.extract_cmd(target)], input=data, stdout=subprocess.DEVNULL, check=True)
+                    self.assertEqual(os.listdir(os.path.join(target, "fake")), ["test.sh"])
+
+    def test_codec_fingerprint(self):
+        self.assertNotEqual(fingerprint(self.init_dirs, CODECS["bz2"]), fingerprint(self.init_dirs, CODECS["gzip"]))
+
+    @patch.object(sys, "argv", ["test"])
+    def test_pipeline_codec(self):
+        with Pipeline("test", codec="gzip") as pipeline:
+            job = pipeline.job("job")
+            with patch.object(pipeline.bundle_cache, "package", return_value="data"):
+                args = job.concourse()["plan"][0]["config"]["run"]["args"]
+            self.assertEqual(args[1], 'echo "data" | base64 -d | tar -C scripts -xvzf -')
+
+    def test_precompile(self):
+        with open(os.path.join(self.scripts, "helper.py"), "w") as f:
+            f.write("VALUE = 42\n")
+        version = "%d.%d" % sys.version_info[:2]
+        data = base64.b64decode(BundleCache("", codec="none", precompile=version).package(self.init_dirs))
+        with tempfile.TemporaryDirectory() as target:
+            subprocess.run(["bash", "-c", CODECS["none"].extract_cmd(target)], input=data, stdout=subprocess.DEVNULL, check=True)
+            self.assertEqual(os.listdir(os.path.join(target, "fake", "__pycache__")), [f"helper.{sys.implementation.cache_tag}.pyc"])
+            # the bytecode is used although the source has been modified
+            with open(os.path.join(target, "fake", "helper.py"), "w") as f:
+                f.write("VALUE = 0\n")
+            result = subprocess.run([sys.executable, "-B", "-c", "import helper; print(helper.VALUE)"], cwd=os.path.join(target, "fake"), stdout=subprocess.PIPE, check=True)
+            self.assertEqual(result.stdout, b"42\n")
+
+    def test_precompile_unavailable(self):
+        with open(os.path.join(self.scripts, "helper.py"), "w") as f:
+            f.write("VALUE = 42\n")
+        with self.assertRaises(Exception):
+            BundleCache("", precompile="2.0").package(self.init_dirs)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(Exception):
+            BundleCache("", codec="rar")
+
+
+class TestBundleStore(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = DirectoryBundleStore(os.path.join(self.tmp.name, "store"), bucket="bucket")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch.object(sys, "argv", ["test"])
+    def pipeline(self):
+        with Pipeline("test", bundle_store=self.store) as pipeline:
+            pipeline.job("job")
+            pipeline.bundle_cache.directory = ""
+        return pipeline
+
+    def test_concourse(self):
+        pipeline = self.pipeline()
+        bundle = pipeline.bundle_cache.bundle(pipeline.init_dirs)
+        concourse = pipeline.concourse()
+
+        self.assertNotIn(bundle.encoded(), yaml.dump(concourse))
+        init = concourse["jobs"][0]["plan"][0]["do"]
+        self.assertEqual(init[0], {"get": "script-bundle", "trigger": False})
+        self.assertEqual(init[1]["config"]["run"]["args"][1], f"cat script-bundle/{bundle.digest}.tar.bz2 | tar -C scripts -xvjf -")
+        resource = next(r for r in concourse["resources"] if r.name == "script-bundle")
+        self.assertEqual(resource.source["regexp"], f"pipeline\\-dsl/bundles/({bundle.digest})\\.tar\\.bz2")
+        self.assertIn("gcs", [t["name"] for t in concourse["resource_types"]])
+
+    def test_publish_on_upload(self):
+        pipeline = self.pipeline()
+        bundle = pipeline.bundle_cache.bundle(pipeline.init_dirs)
+        with patch("pipeline_dsl.concourse.pipeline.subprocess") as subprocess, patch.object(sys, "stdout", io.StringIO()):
+            pipeline.upload("target", ledger=FlyLedger(os.path.join(self.tmp.name, "ledger.json")))
+        subprocess.run.assert_called_once()
+        with open(os.path.join(self.tmp.name, "store", "pipeline-dsl", "bundles", bundle.digest + ".tar.bz2"), "rb") as f:
+            self.assertEqual(f.read(), bundle.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
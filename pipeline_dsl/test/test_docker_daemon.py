@@ -0,0 +1,90 @@
+import os
+import socketserver
+import tempfile
+import threading
+import unittest
+from mock import patch
+
+from pipeline_dsl.utils.docker_daemon import DockerDaemon, START_SCRIPT, STOP_SCRIPT
+
+
+class PingHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.rfile.readline()
+        self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nOK")
+
+
+class TestDockerDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self.tmp.name, "docker.sock")
+        self.server = None
+        self.calls = []
+        self.shell = patch("pipeline_dsl.utils.docker_daemon.shell", side_effect=self.fake_shell)
+        self.shell.start()
+        self.daemon = DockerDaemon(socket_path=self.socket, timeout=5)
+
+    def tearDown(self):
+        self.shell.stop()
+        self.stop_server()
+        self.tmp.cleanup()
+
+    def fake_shell(self, cmd):
+        self.calls.append(os.path.basename(cmd[0]))
+        if cmd[0].endswith(START_SCRIPT):
+            # the daemon becomes ready a bit later
+            threading.Timer(0.05, self.start_server).start()
+        elif cmd[0].endswith(STOP_SCRIPT):
+            self.stop_server()
+
+    def start_server(self):
+        self.server = socketserver.UnixStreamServer(self.socket, PingHandler)
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+
+    def stop_server(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            os.unlink(self.socket)
+            self.server = None
+
+    def test_ping(self):
+        self.assertFalse(self.daemon.ping())
+        self.start_server()
+        self.assertTrue(self.daemon.ping())
+
+    def test_reference_counted(self):
+        self.daemon.acquire()
+        self.assertTrue(self.daemon.healthy())
+        self.daemon.acquire()
+        self.daemon.release()
+        self.assertTrue(self.daemon.healthy())
+        self.daemon.release()
+        self.assertFalse(self.daemon.healthy())
+        self.assertEqual(self.calls, ["start-docker.sh", "stop-docker.sh"])
+
+    def test_keep_warm(self):
+        with patch("atexit.register") as register:
+            self.daemon.acquire(keep_warm=True)
+            self.daemon.release()
+            self.daemon.acquire()
+            self.daemon.release()
+        self.assertEqual(self.daemon.health(), {"running": True, "healthy": True, "refs": 0, "keep_warm": True})
+        register.assert_called_once_with(self.daemon.shutdown)
+        self.daemon.shutdown()
+        self.assertEqual(self.calls, ["start-docker.sh", "stop-docker.sh"])
+
+    def test_timeout(self):
+        self.shell.stop()
+        with patch("pipeline_dsl.utils.docker_daemon.shell") as shell:
+            self.daemon.timeout = 0.1
+            with self.assertRaises(Exception):
+                self.daemon.acquire()
+            self.assertEqual(shell.call_count, 2)
+        self.shell.start()
+        self.assertEqual(self.daemon.refs, 0)
+        self.assertFalse(self.daemon.running)
+
+
+if __name__ == "__main__":
+    unittest.main()
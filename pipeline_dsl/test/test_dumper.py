@@ -1,6 +1,7 @@
 from pipeline_dsl import ConcourseResource
-from pipeline_dsl.utils.dumper import NoTagDumper
+from pipeline_dsl.utils.dumper import NoTagDumper, FastNoTagDumper, CompactDumper, SubtreeInterner, YamlStreamWriter
 
+import io
 import unittest
 import yaml
 
@@ -10,3 +11,52 @@ class TestNoTagDumper(unittest.TestCase):
         x = ConcourseResource("name", "type", "icon", "source")
         result = yaml.dump(x, Dumper=NoTagDumper)
         self.assertNotIn("!!python/object", result)
+
+
+class TestFastNoTagDumper(unittest.TestCase):
+    def test_basic(self):
+        x = ConcourseResource("name", "type", "icon", "source")
+        self.assertEqual(yaml.dump(x, Dumper=FastNoTagDumper), yaml.dump(x, Dumper=NoTagDumper))
+
+    def test_no_aliases(self):
+        shared = {"a": 1}
+        result = yaml.dump([shared, shared], Dumper=FastNoTagDumper)
+        self.assertNotIn("&", result)
+
+
+class TestYamlStreamWriter(unittest.TestCase):
+    def test_sections(self):
+        doc = {
+            "groups": [],
+            "jobs": [{"name": "a", "plan": [{"task": "x"}]}, {"name": "b", "plan": []}],
+            "pipeline_metadata": {"name": "test"},
+        }
+        stream = io.StringIO()
+        writer = YamlStreamWriter(stream)
+        writer.sequence("groups", iter([]))
+        writer.sequence("jobs", iter(doc["jobs"]))
+        writer.mapping("pipeline_metadata", doc["pipeline_metadata"])
+
+        self.assertEqual(stream.getvalue(), yaml.dump(doc, Dumper=NoTagDumper))
+
+
+class TestSubtreeInterner(unittest.TestCase):
+    def test_shared(self):
+        config = {"image": "python", "params": {"PYTHONPATH": "scripts/python", "REQUESTS_CA_BUNDLE": "/etc/ssl/certs/ca-certificates.crt"}}
+        doc = [{"task": "a", "config": dict(config)}, {"task": "b", "config": dict(config)}, {"task": "a", "config": dict(config)}]
+        interner = SubtreeInterner()
+        result = interner.intern(doc)
+
+        self.assertEqual(result, doc)
+        self.assertIs(result[0]["config"], result[1]["config"])
+        self.assertIs(result[0], result[2])
+        self.assertEqual(len(interner.shared), 3)
+        text = yaml.dump(result, Dumper=CompactDumper)
+        self.assertEqual(yaml.safe_load(text), doc)
+        self.assertEqual(text.count("&id"), 2)
+
+    def test_small_subtrees(self):
+        doc = [{"get": "repo"}, {"get": "repo"}]
+        result = SubtreeInterner().intern(doc)
+        self.assertIsNot(result[0], result[1])
+        self.assertNotIn("&", yaml.dump(result, Dumper=CompactDumper))
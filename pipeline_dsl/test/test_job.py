@@ -1,11 +1,49 @@
-from pipeline_dsl import Pipeline, PutStep, GetStep, DoStep, GitRepo
+from pipeline_dsl import Pipeline, PutStep, GetStep, DoStep, GitRepo, GithubPR, shell
+from pipeline_dsl.resources.github_pr import GithubPRResource
+from pipeline_dsl.concourse.__shared import CACHE_DIR, concourse_ctx
+from pipeline_dsl.test import isolate_cache
 from mock import patch
+import io
+import json
+import os
+import shutil
+import threading
+import time
 import unittest
 import sys
 
 
 @patch.object(sys, "argv", ["test"])
 class TestJobSimple(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.join(CACHE_DIR, "stale-job"), ignore_errors=True)
+
+    def test_stale_results(self):
+        with Pipeline("test") as pipeline:
+            with pipeline.job("stale-job") as job:
+
+                @job.task()
+                def version():
+                    return "new"
+
+                @job.task()
+                def use():
+                    return version()
+
+            pipeline.jobs.remove(job)
+        for run in [lambda: job.run_task("use"), job.run]:
+            # left over by a previous run of a different version of the pipeline
+            os.makedirs(os.path.join(CACHE_DIR, "stale-job"), exist_ok=True)
+            with open(os.path.join(CACHE_DIR, "stale-job", "version.json"), "w") as f:
+                json.dump("old", f)
+            with patch.object(sys, "stdout", io.StringIO()):
+                run()
+            with open(os.path.join(CACHE_DIR, "stale-job", "use.json")) as f:
+                self.assertEqual(json.load(f), "new")
+
     def test_basic(self):
         with Pipeline("test", script_dirs={"fake": "fake_scripts"}) as pipeline:
             job = pipeline.job("job")
@@ -248,3 +286,133 @@ class TestJobSimple(unittest.TestCase):
                     {"name": "tasks"},
                 ],
             )
+
+    def test_changed_files(self):
+        with Pipeline("test") as pipeline:
+            pipeline.resource("repo", GitRepo("https://example.com/repo.git"))
+            pipeline.resource("pr", GithubPR("org/repo", "((TOKEN))"))
+            pipeline.resource("other-pr", GithubPR("org/other", "((TOKEN))"))
+            job = pipeline.job("job")
+            job.get("repo")
+            job.get("pr")
+
+            with patch.object(GithubPRResource, "iter_changed_files", return_value=iter(["a"])):
+                self.assertIsNone(job.changed_files()())
+                with concourse_ctx(True):
+                    self.assertEqual(list(job.changed_files()()), ["a"])
+                    job.get("other-pr")
+                    with self.assertRaises(Exception):
+                        job.changed_files()()
+
+
+@patch.object(sys, "argv", ["test"])
+class TestParallelRun(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def job(self, tasks, fail_fast=False, limit=None):
+        with Pipeline("test") as pipeline:
+            job = pipeline.job("job")
+            with job.in_parallel(fail_fast=fail_fast, limit=limit) as parallel:
+                for name, fn in tasks.items():
+                    parallel.task(name=name)(fn)
+            pipeline.jobs.remove(job)
+        return job
+
+    def test_concurrent(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def task(name):
+            def fn():
+                barrier.wait()
+                print(f"{name}-1")
+                shell(["echo", f"{name}-2"])
+                time.sleep(0.05)
+                print(f"{name}-3")
+
+            return fn
+
+        job = self.job({"a": task("a"), "b": task("b")})
+        stdout = io.StringIO()
+        with patch.object(sys, "stdout", stdout):
+            job.run(max_parallelism=2)
+        lines = stdout.getvalue().splitlines()
+        for name in ["a", "b"]:
+            start = lines.index(f"Running: {name}")
+            self.assertEqual(lines[start : start + 5], [f"Running: {name}", f"{name}-1", f"echo {name}-2", f"{name}-2", f"{name}-3"])
+
+    def test_limit(self):
+        running = []
+
+        def task():
+            running.append(threading.get_ident())
+            self.assertEqual(len(running), 1)
+            time.sleep(0.01)
+            running.pop()
+
+        job = self.job({"a": task, "b": task, "c": task}, limit=1)
+        job.run(max_parallelism=4)
+
+    def test_fail_fast(self):
+        executed = []
+
+        def fail():
+            raise Exception("a failed")
+
+        job = self.job({"a": fail, "b": lambda: time.sleep(0.1), "c": lambda: executed.append("c")}, fail_fast=True)
+        with self.assertRaisesRegex(Exception, "a failed"):
+            job.run(max_parallelism=1)
+        with self.assertRaisesRegex(Exception, "a failed"):
+            job.run(max_parallelism=2)
+        self.assertNotIn("c", executed)
+
+    def test_collect_all(self):
+        executed = []
+
+        def fail():
+            raise Exception("a failed")
+
+        job = self.job({"a": fail, "b": lambda: executed.append("b"), "c": lambda: executed.append("c")})
+        with self.assertRaisesRegex(Exception, "a failed"):
+            job.run(max_parallelism=2)
+        self.assertEqual(sorted(executed), ["b", "c"])
+
+    def test_collect_all_sequential(self):
+        executed = []
+
+        def fail():
+            raise Exception("a failed")
+
+        job = self.job({"a": fail, "b": lambda: executed.append("b"), "c": lambda: executed.append("c")})
+        with self.assertRaisesRegex(Exception, "a failed"):
+            job.run(max_parallelism=1)
+        self.assertEqual(executed, ["b", "c"])
+
+    def test_aborted(self):
+        aborted = threading.Event()
+        executed = []
+
+        def interrupted():
+            executed.append("a")
+            aborted.set()
+
+        for limit in [1, 2]:
+            aborted.clear()
+            executed.clear()
+            with Pipeline("test") as pipeline:
+                job = pipeline.job("job")
+                job.task(name="a")(interrupted)
+                with job.in_parallel(limit=limit) as parallel:
+                    parallel.task(name="b")(lambda: executed.append("b"))
+                    parallel.task(name="c")(lambda: executed.append("c"))
+                pipeline.jobs.remove(job)
+            with patch.object(sys, "stdout", io.StringIO()), self.assertRaisesRegex(Exception, "job aborted"):
+                job.run(max_parallelism=2, aborted=aborted)
+            self.assertEqual(executed, ["a"])
+            with patch.object(sys, "stdout", io.StringIO()), self.assertRaisesRegex(Exception, "job aborted"):
+                job.plan[-1].run(max_parallelism=2, aborted=aborted)
+            self.assertEqual(executed, ["a"])
+
+    def test_concourse_limit(self):
+        job = self.job({"a": lambda: None}, limit=2)
+        self.assertEqual(job.concourse()["plan"][1]["in_parallel"]["limit"], 2)
@@ -0,0 +1,121 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from mock import patch
+
+from pipeline_dsl import Pipeline
+from pipeline_dsl.shell import shell
+from pipeline_dsl.utils.modify_git_repo import copy_git_repo, modify_git_repo
+from pipeline_dsl.test import isolate_cache
+
+
+def git(*args, cwd):
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] + list(args), cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode(
+        "utf-8"
+    )
+
+
+class TestModifyGitRepo(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "source")
+        self.target = os.path.join(self.tmp.name, "target")
+        os.makedirs(os.path.join(self.source, "dir"))
+        git("init", "-q", cwd=self.source)
+        with open(os.path.join(self.source, "dir", "file"), "w") as f:
+            f.write("content\n")
+        git("add", "-A", cwd=self.source)
+        git("commit", "-q", "-m", "initial", cwd=self.source)
+        self.head = git("rev-parse", "HEAD", cwd=self.source)
+        self.object = os.path.join(".git", "objects", self.head[:2], self.head[2:].strip())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def inode(self, root, path):
+        return os.stat(os.path.join(root, path)).st_ino
+
+    def test_fast_copy(self):
+        copy_git_repo(self.source, self.target)
+        self.assertEqual(self.inode(self.source, self.object), self.inode(self.target, self.object))
+        self.assertNotEqual(self.inode(self.source, "dir/file"), self.inode(self.target, "dir/file"))
+        self.assertNotEqual(self.inode(self.source, ".git/HEAD"), self.inode(self.target, ".git/HEAD"))
+        self.assertEqual(git("status", "--porcelain", cwd=self.target), "")
+
+    def test_fallback(self):
+        commands = []
+
+        def failing_hardlinks(cmd, **kwargs):
+            commands.append(cmd)
+            if "-l" in cmd:
+                raise Exception("hard links not supported")
+            return shell(cmd, **kwargs)
+
+        # the package exports the function modify_git_repo under the name of its module
+        with patch.object(sys.modules["pipeline_dsl.utils.modify_git_repo"], "shell", side_effect=failing_hardlinks):
+            copy_git_repo(self.source, self.target)
+        # nothing is copied before the hard links failed
+        self.assertEqual([cmd[:3] for cmd in commands], [["rm", "-rf", self.target], ["cp", "-a", "-l"], ["rm", "-rf", self.target], ["cp", "-a", self.source]])
+        self.assertNotEqual(self.inode(self.source, self.object), self.inode(self.target, self.object))
+        self.assertEqual(git("rev-parse", "HEAD", cwd=self.target), self.head)
+
+    def test_modify(self):
+        with modify_git_repo(self.source, self.target, "change"):
+            with open(os.path.join("dir", "file"), "w") as f:
+                f.write("changed\n")
+        self.assertEqual(git("log", "--format=%s", cwd=self.target).split(), ["change", "initial"])
+        self.assertEqual(git("rev-parse", "HEAD", cwd=self.source), self.head)
+        self.assertEqual(git("status", "--porcelain", cwd=self.source), "")
+
+    def test_concurrent_jobs(self):
+        barrier = threading.Barrier(2, timeout=10)
+        inside = []
+        results = {}
+
+        def job(pipeline, name):
+            with pipeline.job(name) as job:
+
+                @job.task(outputs=["out"])
+                def modify(out):
+                    # both jobs are running, but only one of them is inside the block at a time
+                    barrier.wait()
+                    target = os.path.join(self.tmp.name, name)
+                    with modify_git_repo(self.source, target, f"change {name}"):
+                        inside.append(name)
+                        self.assertEqual(inside, [name])
+                        time.sleep(0.1)
+                        with open(os.path.join("dir", "file"), "w") as f:
+                            f.write(f"{name}\n")
+                        inside.remove(name)
+                    with open(os.path.join(out, "name"), "w") as f:
+                        f.write(name)
+                    return target
+
+                @job.task(outputs=["out"])
+                def check(out):
+                    with open(os.path.join(out, "name")) as f:
+                        results[name] = (modify(), f.read())
+
+        cwd = os.getcwd()
+        with patch.object(sys, "argv", ["test", "--max-parallelism", "2"]), patch.object(sys, "stdout", io.StringIO()):
+            with Pipeline("test") as pipeline:
+                job(pipeline, "a")
+                job(pipeline, "b")
+        self.assertEqual(os.getcwd(), cwd)
+        for name in ["a", "b"]:
+            target = os.path.join(self.tmp.name, name)
+            self.assertEqual(results[name], (target, name))
+            self.assertEqual(git("log", "--format=%s", cwd=target).split("\n")[:2], [f"change {name}", "initial"])
+            with open(os.path.join(target, "dir", "file")) as f:
+                self.assertEqual(f.read(), f"{name}\n")
+        self.assertEqual(git("status", "--porcelain", cwd=self.source), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
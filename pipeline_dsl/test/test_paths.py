@@ -0,0 +1,52 @@
+import unittest
+
+from pipeline_dsl.concourse.paths import PathMatcher, PathFilter
+
+
+class TestPathMatcher(unittest.TestCase):
+    def test_directory(self):
+        matcher = PathMatcher(["src/component-a", "docs/"])
+        self.assertTrue(matcher.match("src/component-a/main.go"))
+        self.assertTrue(matcher.match("src/component-a"))
+        self.assertTrue(matcher.match("docs/index.md"))
+        self.assertFalse(matcher.match("src/component-b/main.go"))
+        self.assertFalse(matcher.match("src/component-ab/main.go"))
+
+    def test_wildcards(self):
+        matcher = PathMatcher(["src/*/go.mod", "*.md", "charts/?/values.yaml"])
+        self.assertTrue(matcher.match("src/a/go.mod"))
+        self.assertFalse(matcher.match("src/a/b/go.mod"))
+        self.assertTrue(matcher.match("README.md"))
+        self.assertFalse(matcher.match("docs/README.md"))
+        self.assertTrue(matcher.match("charts/x/values.yaml"))
+        self.assertFalse(matcher.match("charts/xy/values.yaml"))
+
+    def test_globstar(self):
+        matcher = PathMatcher(["**/*.py", "deploy/**/kustomization.yaml"])
+        self.assertTrue(matcher.match("setup.py"))
+        self.assertTrue(matcher.match("a/b/c.py"))
+        self.assertTrue(matcher.match("deploy/kustomization.yaml"))
+        self.assertTrue(matcher.match("deploy/a/b/kustomization.yaml"))
+        self.assertFalse(matcher.match("deploy/a/b/values.yaml"))
+
+    def test_many_patterns(self):
+        matcher = PathMatcher([f"components/c-{i}/**" for i in range(500)])
+        self.assertTrue(matcher.match("components/c-499/src/main.go"))
+        self.assertFalse(matcher.match("components/c-500/src/main.go"))
+
+
+class TestPathFilter(unittest.TestCase):
+    def test_affected(self):
+        path_filter = PathFilter(["src/a"], ["**/*.md"])
+        self.assertTrue(path_filter.affected(iter(["README.md", "src/a/main.go"])))
+        self.assertFalse(path_filter.affected(["src/a/README.md", "src/b/main.go"]))
+        self.assertFalse(path_filter.affected([]))
+
+    def test_ignore_only(self):
+        path_filter = PathFilter(ignore_paths=["docs"])
+        self.assertTrue(path_filter.affected(["docs/a.md", "main.go"]))
+        self.assertFalse(path_filter.affected(["docs/a.md"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
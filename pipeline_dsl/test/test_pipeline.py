@@ -1,14 +1,21 @@
 import unittest
 from mock import patch
 
-from pipeline_dsl import Pipeline, InitTask
+from pipeline_dsl import Pipeline, InitTask, GitRepo, shell
 import base64
+import io
+import json
 import os
 import subprocess
 import sys
+import tempfile
 from pipeline_dsl.utils.docker_daemon import START_SCRIPT, STOP_SCRIPT
+from pipeline_dsl.utils.dumper import NoTagDumper
+from pipeline_dsl.concourse.ledger import FlyLedger
 from pipeline_dsl.concourse.__shared import set_concourse_context
+from pipeline_dsl.test import isolate_cache
 from contextlib import contextmanager
+import yaml
 
 
 @contextmanager
@@ -25,6 +32,40 @@ TEST_DIR = os.path.abspath(os.path.dirname(__file__))
 
 @patch.object(sys, "argv", ["test"])
 class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def test_run_summary(self):
+        stdout = io.StringIO()
+        with patch.object(sys, "stdout", stdout):
+            with Pipeline("test") as pipeline:
+                with pipeline.job("job") as job:
+
+                    @job.task()
+                    def task():
+                        pass
+
+        lines = stdout.getvalue().splitlines()
+        header = next(i for i, line in enumerate(lines) if line.startswith("job "))
+        self.assertEqual(lines[header + 1].split()[:3], ["job", "task", "ok"])
+        self.assertTrue(lines[header + 2].startswith("Peak RSS: "))
+
+    def test_trace(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            with patch.object(sys, "argv", ["test", "--trace", path]), patch.object(sys, "stdout", io.StringIO()), patch.object(sys, "stderr", io.StringIO()):
+                with Pipeline("test") as pipeline:
+                    with pipeline.job("job") as job:
+
+                        @job.task(secrets={"home": "HOME"})
+                        def task(home):
+                            shell(["true"])
+
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+        spans = [(e["cat"], e["name"]) for e in events if e["ph"] == "X"]
+        self.assertEqual(spans, [("secret", "prefetch secrets"), ("secret", "secret"), ("shell", "shell"), ("task", "task"), ("job", "job"), ("pipeline", "test")])
+
     def test_init_task(self):
         with Pipeline("test", script_dirs={"fake": "fake_scripts"}) as pipeline:
             with pipeline.job("job") as job:
@@ -59,6 +100,51 @@ class TestPipeline(unittest.TestCase):
             with concourse_ctx():
                 self.assertEqual(pipeline.script_dir("fake"), os.path.abspath("scripts/fake"))
 
+    def test_script(self):
+        self.assertEqual(Pipeline("test").script, __file__)
+        self.assertEqual(Pipeline("test", script="/pipelines/test.py").init_dirs["starter"], "/pipelines")
+
+    def lazy_pipeline(self, evaluated):
+        with Pipeline("test") as pipeline:
+            pipeline.resource("repo", GitRepo("https://example.com/repo.git"))
+
+            @pipeline.job("a")
+            def a(job):
+                evaluated.append("a")
+                job.get("repo")
+
+                @job.task()
+                def task_a():
+                    pass
+
+            @pipeline.job("b")
+            def b(job):
+                evaluated.append("b")
+                job.get("repo")
+
+                @job.task()
+                def task_b():
+                    pass
+
+            with pipeline.job("c") as job:
+                evaluated.append("c")
+                job.get("repo")
+
+        return pipeline
+
+    def test_lazy_jobs(self):
+        evaluated = []
+        with patch.object(sys, "argv", ["test", "--job", "b", "--task", "task-b"]):
+            self.lazy_pipeline(evaluated)
+        self.assertEqual(evaluated, ["c", "b"])
+
+    def test_lazy_jobs_full_evaluation(self):
+        evaluated = []
+        with patch.object(sys, "argv", ["test", "--dump"]), patch.object(sys, "stdout", io.StringIO()):
+            pipeline = self.lazy_pipeline(evaluated)
+        self.assertEqual(evaluated, ["a", "b", "c"])
+        self.assertEqual(pipeline.jobs_by_name["c"].plan[1].passed, ["a", "b"])
+
     def test_job_groups(self):
         with Pipeline("test") as pipeline:
             with pipeline.job("job-a", groups=["a"]) as job:
@@ -95,6 +181,101 @@ class TestPipeline(unittest.TestCase):
                 concourse["groups"],
             )
 
+    def test_dump(self):
+        with Pipeline("test") as pipeline:
+            pipeline.resource("repo", GitRepo("https://example.com/repo.git"))
+            with pipeline.job("job", groups=["a"]) as job:
+                job.get("repo")
+
+                @job.task()
+                def task():
+                    pass
+
+            stream = io.StringIO()
+            with patch.object(pipeline.bundle_cache, "package", return_value="data"):
+                pipeline.dump(stream)
+                self.assertEqual(yaml.safe_load(stream.getvalue()), yaml.safe_load(yaml.dump(pipeline.concourse(), Dumper=NoTagDumper)))
+
+    def test_dump_compact(self):
+        with Pipeline("test") as pipeline:
+            for name in ["a", "b"]:
+                with pipeline.job(name) as job:
+
+                    @job.task()
+                    def task():
+                        pass
+
+            stream = io.StringIO()
+            compact = io.StringIO()
+            with patch.object(pipeline.bundle_cache, "package", return_value="data"), patch.object(sys, "stderr", io.StringIO()) as stderr:
+                entry = pipeline.dump(stream)
+                self.assertEqual(pipeline.dump(compact, compact=True), entry)
+
+            self.assertIn("&id", compact.getvalue())
+            self.assertLess(len(compact.getvalue()), len(stream.getvalue()))
+            self.assertEqual(yaml.safe_load(compact.getvalue()), yaml.safe_load(stream.getvalue()))
+            self.assertIn(f"{len(stream.getvalue()) - len(compact.getvalue())} bytes saved", stderr.getvalue())
+
+
+FAKE_FLY = """#!/bin/sh
+echo "$@" >> "$FLY_LOG"
+"""
+
+
+class TestUpload(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+        self.tmp = tempfile.TemporaryDirectory()
+        fly = os.path.join(self.tmp.name, "fly")
+        with open(fly, "w") as f:
+            f.write(FAKE_FLY)
+        os.chmod(fly, 0o755)
+        self.log = os.path.join(self.tmp.name, "fly.log")
+        self.env = patch.dict(os.environ, {"PATH": self.tmp.name + os.pathsep + os.environ["PATH"], "FLY_LOG": self.log})
+        self.env.start()
+        self.ledger = FlyLedger(os.path.join(self.tmp.name, "ledger.json"))
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def fly_calls(self):
+        try:
+            with open(self.log) as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def pipeline(self, jobs):
+        with patch.object(sys, "argv", ["test"]):
+            with Pipeline("test-upload") as pipeline:
+                pipeline.resource("repo", GitRepo("https://example.com/repo.git"))
+                for name in jobs:
+                    pipeline.job(name).get("repo")
+                pipeline.bundle_cache.directory = ""
+        return pipeline
+
+    def test_skip_unchanged(self):
+        pipeline = self.pipeline(["job-a"])
+        pipeline.upload("target", ledger=self.ledger)
+        pipeline.upload("target", ledger=self.ledger)
+        self.assertEqual(self.fly_calls(), ["-t target set-pipeline -c /tmp/test-upload.yaml -p test-upload -n"])
+
+        pipeline.upload("target", force=True, ledger=self.ledger)
+        self.assertEqual(len(self.fly_calls()), 2)
+
+        pipeline.upload("other-target", ledger=self.ledger)
+        self.assertEqual(len(self.fly_calls()), 3)
+
+    def test_diff_only(self):
+        self.pipeline(["job-a", "job-b"]).upload("target", ledger=self.ledger)
+        pipeline = self.pipeline(["job-a", "job-c"])
+        stdout = io.StringIO()
+        with patch.object(sys, "stdout", stdout):
+            pipeline.upload("target", diff_only=True, ledger=self.ledger)
+        self.assertEqual(stdout.getvalue().splitlines(), ["+ jobs job-c", "- jobs job-b"])
+        self.assertEqual(len(self.fly_calls()), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
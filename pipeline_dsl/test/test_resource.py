@@ -1,6 +1,10 @@
 import unittest
 import os
+import subprocess
+import tempfile
+from mock import patch
 from pipeline_dsl.resources import GitRepo, Cron, DockerImage, GoogleCloudStorage, Pool, GithubRelease, SemVer, SemVerGitDriver, RegistryImage, GithubPR, ConcourseResource
+from pipeline_dsl.resources.git import resolve_head
 from pipeline_dsl.concourse.__shared import concourse_ctx
 
 
@@ -59,6 +63,81 @@ class TestGitResource(unittest.TestCase):
         )
 
 
+class TestGitRepoResource(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "repo")
+        os.makedirs(self.path)
+        self.git("init", "-q")
+        self.commit("initial")
+        with concourse_ctx(False):
+            self.resource = GitRepo("https://example.com/repo.git").get("repo")
+        self.resource.path = self.path
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def git(self, *args, cwd=None):
+        cmd = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] + list(args)
+        return subprocess.run(cmd, cwd=cwd or self.path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode("utf-8").strip()
+
+    def commit(self, message):
+        self.git("commit", "-q", "--allow-empty", "-m", message)
+        return self.git("rev-parse", "HEAD")
+
+    def test_resolve_head(self):
+        head = self.git("rev-parse", "HEAD")
+        self.assertEqual(resolve_head(self.path), head)
+        self.git("pack-refs", "--all")
+        self.assertEqual(resolve_head(self.path), head)
+        self.git("checkout", "-q", "--detach")
+        self.assertEqual(resolve_head(self.path), head)
+        worktree = os.path.join(self.tmp.name, "worktree")
+        self.git("worktree", "add", "-q", "-b", "other", worktree)
+        self.git("commit", "-q", "--allow-empty", "-m", "other", cwd=worktree)
+        self.assertEqual(resolve_head(worktree), self.git("rev-parse", "HEAD", cwd=worktree))
+
+    def test_unborn_branch(self):
+        self.git("checkout", "-q", "--orphan", "unborn")
+        self.assertIsNone(resolve_head(self.path))
+
+    def test_memoized(self):
+        self.git("tag", "v1")
+        with patch("pipeline_dsl.resources.git.subprocess.check_output", wraps=subprocess.check_output) as check_output:
+            self.assertEqual(self.resource.ref(), "v1")
+            self.assertEqual(self.resource.tag(), "v1")
+            short_ref = self.resource.short_ref()
+            self.assertEqual(self.resource.short_ref(), short_ref)
+            self.assertEqual(check_output.call_count, 2)
+
+            # a new commit changes HEAD
+            head = self.commit("second")
+            self.assertTrue(self.resource.tag().startswith("v1-1-g"))
+            self.assertTrue(head.startswith(self.resource.short_ref()))
+            self.assertEqual(check_output.call_count, 4)
+
+            # a new tag changes the result of describe
+            self.git("tag", "v2")
+            self.assertEqual(self.resource.tag(), "v2")
+            self.assertEqual(check_output.call_count, 5)
+
+    def test_memoized_nested_tags(self):
+        self.git("tag", "release/0.9")
+        self.commit("second")
+        self.assertTrue(self.resource.tag().startswith("release/0.9-1-g"))
+        # only changes refs/tags/release, not refs/tags
+        self.git("tag", "release/1.0")
+        self.assertEqual(self.resource.tag(), "release/1.0")
+        self.git("tag", "-d", "release/1.0")
+        self.assertTrue(self.resource.tag().startswith("release/0.9-1-g"))
+
+    def test_ref_without_tags(self):
+        with patch("pipeline_dsl.resources.git.subprocess.check_output", wraps=subprocess.check_output) as check_output:
+            self.assertEqual(self.resource.ref(), self.git("rev-parse", "HEAD"))
+            self.assertEqual(self.resource.ref(), self.git("rev-parse", "HEAD"))
+            self.assertEqual(check_output.call_count, 1)
+
+
 class TestCronResource(unittest.TestCase):
     def test_basic(self):
         repo = Cron("definition")
@@ -326,6 +405,28 @@ class TestGithubPRResource(unittest.TestCase):
             ),
         )
 
+    def test_changed_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, ".git", "resource"))
+            with open(os.path.join(tmp, ".git", "resource", "changed_files"), "w") as f:
+                f.write("README.md\nsrc/a.py\nsrc/b.go\nsrc/sub/c.py\n")
+            with open(os.path.join(tmp, ".git", "resource", "metadata.json"), "w") as f:
+                f.write('[{"name": "pr", "value": "1"}]')
+            pr = GithubPR("torvalds/linux", "((GITHUB_TOKEN))").get("pr")
+            pr.path = tmp
+
+            with concourse_ctx(True):
+                self.assertEqual(pr.changed_files(), ["README.md", "src/a.py", "src/b.go", "src/sub/c.py"])
+                self.assertEqual(list(pr.iter_changed_files(prefix="src/")), ["src/a.py", "src/b.go", "src/sub/c.py"])
+                self.assertEqual(list(pr.iter_changed_files(prefix="src/", pattern="*.py")), ["src/a.py", "src/sub/c.py"])
+                self.assertEqual(pr.metadata(), [{"name": "pr", "value": "1"}])
+                os.remove(os.path.join(tmp, ".git", "resource", "metadata.json"))
+                self.assertEqual(pr.metadata(), [{"name": "pr", "value": "1"}])
+
+            with concourse_ctx(False):
+                self.assertEqual(pr.changed_files(), None)
+                self.assertEqual(list(pr.iter_changed_files(pattern="*.md", default=["a.md", "b.txt"])), ["a.md"])
+
 
 if __name__ == "__main__":
     unittest.main()
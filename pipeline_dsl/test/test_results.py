@@ -0,0 +1,53 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+from mock import patch
+
+from pipeline_dsl.concourse import results
+from pipeline_dsl.concourse.results import RESULT_CODECS, get_result_codec, msgpack_available
+
+RESULT = {"files": [f"src/file-{i}.go" for i in range(1000)], "digest": "abc", "count": 3, "ratio": 0.5, "missing": None}
+
+
+class TestResultCodecs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def roundtrip(self, codec, result):
+        path = os.path.join(self.tmp.name, "result" + codec.extension)
+        codec.dump(result, path)
+        return codec.load(path)
+
+    def test_json(self):
+        self.assertEqual(self.roundtrip(RESULT_CODECS["json"], RESULT), RESULT)
+
+    def test_pickle(self):
+        result = dict(RESULT, data=b"\0" * 1000000, pair=(1, 2), tags={"a", "b"})
+        self.assertEqual(self.roundtrip(RESULT_CODECS["pickle"], result), result)
+        self.assertIsNone(self.roundtrip(RESULT_CODECS["pickle"], None))
+
+    @unittest.skipUnless(msgpack_available(), "msgpack is not installed")
+    def test_msgpack(self):
+        result = dict(RESULT, data=b"\0" * 1000000, numbers={1: "one"})
+        self.assertEqual(self.roundtrip(RESULT_CODECS["msgpack"], result), result)
+
+    def test_get_result_codec(self):
+        self.assertIs(get_result_codec("pickle"), RESULT_CODECS["pickle"])
+        self.assertIs(get_result_codec(RESULT_CODECS["json"]), RESULT_CODECS["json"])
+        self.assertEqual(get_result_codec("msgpack").name, "msgpack" if msgpack_available() else "pickle")
+        with self.assertRaises(Exception):
+            get_result_codec("yaml")
+
+    def test_msgpack_missing(self):
+        with patch.object(results, "msgpack", None), patch.object(sys, "stderr", io.StringIO()) as stderr:
+            self.assertEqual(get_result_codec("msgpack").name, "pickle")
+        self.assertIn("msgpack module is not available", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+from pipeline_dsl import Pipeline, GitRepo
+from pipeline_dsl.concourse.scheduler import JobScheduler
+from pipeline_dsl.test import isolate_cache
+from mock import patch
+import os
+import signal
+import sys
+import threading
+import time
+import unittest
+
+
+@patch.object(sys, "argv", ["test"])
+class TestJobScheduler(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def pipeline(self, serial_groups={}):
+        # a -> (b, c) -> d
+        with Pipeline("test") as pipeline:
+            pipeline.resource("repo", GitRepo("https://example.com/repo.git"))
+            for name in ["a", "b", "c"]:
+                pipeline.job(name, serial_groups=serial_groups.get(name, [])).get("repo", passed=[] if name == "a" else ["a"])
+            pipeline.job("d").get("repo", passed=["b", "c"])
+            pipeline.jobs = []
+        return pipeline
+
+    def run_jobs(self, pipeline, max_workers, fn):
+        jobs = [pipeline.jobs_by_name[name] for name in ["a", "b", "c", "d"]]
+        scheduler = JobScheduler(jobs, max_workers)
+        scheduler.run(fn)
+        return scheduler
+
+    def test_dependencies(self):
+        pipeline = self.pipeline()
+        scheduler = JobScheduler(list(pipeline.jobs_by_name.values()))
+        self.assertEqual(scheduler.dependencies, {"a": set(), "b": {"a"}, "c": {"a"}, "d": {"b", "c"}})
+
+    def test_order(self):
+        order = []
+        self.run_jobs(self.pipeline(), 1, lambda job: order.append(job.name))
+        self.assertEqual(order, ["a", "b", "c", "d"])
+
+    def test_concurrent(self):
+        barrier = threading.Barrier(2, timeout=5)
+        order = []
+
+        def run(job):
+            if job.name in ["b", "c"]:
+                barrier.wait()
+            order.append(job.name)
+
+        self.run_jobs(self.pipeline(), 4, run)
+        self.assertEqual(order[0], "a")
+        self.assertEqual(order[3], "d")
+
+    def test_serial_groups(self):
+        running = []
+
+        def run(job):
+            running.append(job.name)
+            self.assertLessEqual(len(running), 1)
+            time.sleep(0.01)
+            running.remove(job.name)
+
+        self.run_jobs(self.pipeline(serial_groups={"b": ["deploy"], "c": ["deploy"]}), 4, run)
+
+    def test_failure(self):
+        order = []
+
+        def run(job):
+            order.append(job.name)
+            if job.name == "a":
+                raise Exception("a failed")
+
+        with self.assertRaisesRegex(Exception, "a failed"):
+            self.run_jobs(self.pipeline(), 4, run)
+        self.assertEqual(order, ["a"])
+
+    def test_inline(self):
+        threads = set()
+        self.run_jobs(self.pipeline(), 1, lambda job: threads.add(threading.current_thread()))
+        self.assertEqual(threads, {threading.main_thread()})
+
+    def test_interrupt(self):
+        started = threading.Event()
+        order = []
+
+        def run(job):
+            order.append(job.name)
+            started.set()
+            # a job checks the abort flag before each of its tasks
+            for _ in range(50):
+                if scheduler.aborted.is_set():
+                    raise Exception("aborted")
+                time.sleep(0.02)
+
+        def interrupt():
+            started.wait(5)
+            os.kill(os.getpid(), signal.SIGINT)
+
+        scheduler = JobScheduler([self.pipeline().jobs_by_name[name] for name in ["a", "b", "c", "d"]], 4)
+        threading.Thread(target=interrupt).start()
+        start = time.monotonic()
+        with self.assertRaises(KeyboardInterrupt):
+            scheduler.run(run)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertTrue(scheduler.aborted.is_set())
+        self.assertEqual(order, ["a"])
+
+    def test_critical_path(self):
+        durations = {"a": 0.01, "b": 0.05, "c": 0.01, "d": 0.01}
+        scheduler = self.run_jobs(self.pipeline(), 4, lambda job: time.sleep(durations[job.name]))
+        _, path = scheduler.critical_path()
+        self.assertEqual(path, ["a", "b", "d"])
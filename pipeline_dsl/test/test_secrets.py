@@ -0,0 +1,114 @@
+from pipeline_dsl import Pipeline
+from pipeline_dsl.concourse.pipeline import vault_secret_manager
+from pipeline_dsl.concourse.secrets import VaultSecretManager
+from pipeline_dsl.test import isolate_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mock import patch
+import io
+import json
+import sys
+import threading
+import time
+import unittest
+
+SECRETS = {
+    "/v1/concourse/main/kv1": {"data": {"value": "secret-1"}},
+    "/v1/concourse/main/kv2": {"data": {"data": {"value": "secret-2"}, "metadata": {}}},
+}
+
+
+class VaultStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers["X-Vault-Token"]))
+        self.server.connections.add(self.client_address)
+        if self.path == "/v1/concourse/main/broken":
+            self.respond(500, {"errors": ["internal"]})
+        elif self.path in SECRETS:
+            self.respond(200, SECRETS[self.path])
+        else:
+            self.respond(404, {"errors": []})
+
+    def respond(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestVaultSecretManager(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), VaultStub)
+        self.server.requests = []
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+        self.manager = VaultSecretManager(f"http://127.0.0.1:{self.server.server_port}", token="token")
+
+    def tearDown(self):
+        self.manager.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_read(self):
+        self.assertEqual(self.manager("/concourse/main/kv1"), "secret-1")
+        self.assertEqual(self.manager("/concourse/main/kv2"), "secret-2")
+        self.assertIsNone(self.manager("/concourse/main/missing"))
+        self.assertEqual(self.server.requests[0], ("/v1/concourse/main/kv1", "token"))
+        with self.assertRaisesRegex(Exception, "status 500"):
+            self.manager("/concourse/main/broken")
+
+    def test_prefetch(self):
+        self.manager.prefetch(["/concourse/main/kv1", "/concourse/main/kv2"])
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(self.manager("/concourse/main/kv1"), "secret-1")
+        self.assertEqual(self.manager("/concourse/main/kv2"), "secret-2")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_ttl(self):
+        self.manager.ttl = 0.01
+        self.manager("/concourse/main/kv1")
+        time.sleep(0.02)
+        self.manager("/concourse/main/kv1")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_close(self):
+        self.manager("/concourse/main/kv1")
+        thread = threading.Thread(target=self.manager, args=["/concourse/main/kv2"])
+        thread.start()
+        thread.join()
+        # one connection per thread
+        self.assertEqual(len(self.manager.connections), 2)
+        connections = set(self.manager.connections)
+        self.manager.close()
+        self.assertEqual(self.manager.connections, set())
+        self.assertTrue(all(connection.sock is None for connection in connections))
+        # cached secrets are still available, new requests open a new connection
+        self.assertEqual(self.manager("/concourse/main/kv1"), "secret-1")
+        self.assertIsNone(self.manager("/concourse/main/missing"))
+        self.assertEqual(len(self.server.connections), 3)
+
+
+class TestSecretManagerArgument(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def secret_manager(self, *args):
+        with patch.object(sys, "argv", ["test", "--dump"] + list(args)), patch.object(sys, "stdout", io.StringIO()):
+            with Pipeline("test") as pipeline:
+                pass
+        return pipeline.secret_manager
+
+    def test_vault(self):
+        self.assertIs(self.secret_manager("--secret-manager", "vault"), vault_secret_manager)
+
+    def test_vault_http(self):
+        secret_manager = self.secret_manager("--secret-manager", "vault-http")
+        self.assertIsInstance(secret_manager, VaultSecretManager)
+        self.assertEqual(secret_manager.connections, set())
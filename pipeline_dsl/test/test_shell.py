@@ -0,0 +1,135 @@
+import unittest
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+import subprocess
+import threading
+import traceback
+from mock import patch
+
+from pipeline_dsl import shell, shell_lines, shell_many, ashell, output, Password, ShellPool
+
+BOTH_STREAMS = "for i in $(seq 1 20000); do echo out-$i; echo err-$i >&2; done"
+
+
+class TestShell(unittest.TestCase):
+    def test_stream(self):
+        lines = []
+        with tempfile.TemporaryDirectory() as tmp, patch.object(sys, "stdout", io.StringIO()) as stdout, patch.object(sys, "stderr", io.StringIO()) as stderr:
+            tee = os.path.join(tmp, "log")
+            # both pipes are filled, reading only one of them would deadlock
+            result = shell(["bash", "-c", BOTH_STREAMS], on_line=lines.append, tee=tee, tail=2)
+            with open(tee) as f:
+                self.assertEqual(len(f.readlines()), 40000)
+        self.assertEqual(len(lines), 40000)
+        self.assertEqual(len(result.stdout.splitlines()), 2)
+        self.assertEqual(stdout.getvalue().count("\nout-"), 20000)
+        self.assertEqual(stderr.getvalue().count("err-"), 20000)
+
+    def test_stream_quiet(self):
+        with patch.object(sys, "stdout", io.StringIO()) as stdout, self.assertRaises(subprocess.CalledProcessError) as ctx:
+            shell(["bash", "-c", "printf 'a\\nb\\nc'; exit 3"], capture_output=True, tail=2)
+        self.assertEqual(ctx.exception.output, "b\nc")
+        self.assertEqual(stdout.getvalue(), "bash -c printf 'a\\nb\\nc'; exit 3\n")
+
+    def test_input(self):
+        data = b"x" * 1000000 + b"\n"
+        with patch.object(sys, "stdout", io.StringIO()):
+            lines = list(shell_lines(["cat"], input=data))
+        self.assertEqual(lines, [data.decode()])
+
+    def test_lines_closed(self):
+        with patch.object(sys, "stdout", io.StringIO()):
+            start = time.monotonic()
+            lines = shell_lines(["bash", "-c", "echo first; sleep 30"])
+            self.assertEqual(next(lines), "first\n")
+            lines.close()
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_lines_failed(self):
+        with patch.object(sys, "stdout", io.StringIO()), self.assertRaises(subprocess.CalledProcessError):
+            list(shell_lines(["false"]))
+
+    def test_captured(self):
+        with patch.object(sys, "stdout", io.StringIO()), patch.object(sys, "stderr", io.StringIO()), output.routed(), output.captured() as buffer:
+            shell(["bash", "-c", "echo out; echo err >&2"])
+        self.assertEqual(sorted(buffer.getvalue().splitlines()), ["bash -c echo out; echo err >&2", "err", "out"])
+
+
+class TestShellMany(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_concurrent(self):
+        cmds = [["bash", "-c", f"sleep 0.3; echo {i}"] for i in range(4)]
+        start = time.monotonic()
+        with patch.object(sys, "stdout", io.StringIO()) as stdout:
+            results = shell_many(cmds, max_workers=4, capture_output=True)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual([result.stdout for result in results], [b"0\n", b"1\n", b"2\n", b"3\n"])
+        self.assertEqual(stdout.getvalue().count("Finished after"), 4)
+
+    def test_fail_fast(self):
+        cmds = [["bash", "-c", Password("exit 1 # secret-token")]] + [["touch", os.path.join(self.tmp, str(i))] for i in range(4)]
+        with patch.object(sys, "stdout", io.StringIO()) as stdout, self.assertRaises(Exception) as ctx:
+            shell_many(cmds, max_workers=1)
+        self.assertEqual(os.listdir(self.tmp), [])
+        self.assertIn("Failed after", stdout.getvalue())
+        self.assertEqual(str(ctx.exception), "1 of 5 commands failed:\n  bash -c <redacted>: exit status 1")
+        self.assertNotIn("secret-token", "".join(traceback.format_exception(type(ctx.exception), ctx.exception, ctx.exception.__traceback__)))
+
+    def test_collect_all(self):
+        cmds = [["bash", "-c", Password("exit 2 # secret-token")], ["touch", os.path.join(self.tmp, "done")], ["bash", "-c", "exit 1"]]
+        with patch.object(sys, "stdout", io.StringIO()), self.assertRaises(Exception) as ctx:
+            with ShellPool(max_workers=1, fail_fast=False) as pool:
+                for cmd in cmds:
+                    pool.shell(cmd)
+        self.assertEqual(os.listdir(self.tmp), ["done"])
+        self.assertEqual(str(ctx.exception), "2 of 3 commands failed:\n  bash -c <redacted>: exit status 2\n  bash -c exit 1: exit status 1")
+        self.assertNotIn("secret-token", "".join(traceback.format_exception(type(ctx.exception), ctx.exception, ctx.exception.__traceback__)))
+
+
+class TestAsyncShell(unittest.TestCase):
+    def test_concurrent(self):
+        async def run():
+            return await asyncio.gather(ashell(["bash", "-c", "sleep 0.5; echo a"], tail=1), ashell(["bash", "-c", "sleep 0.5; echo b"], capture_output=True))
+
+        start = time.monotonic()
+        with patch.object(sys, "stdout", io.StringIO()) as stdout:
+            a, b = asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(a.stdout, "a\n")
+        self.assertEqual(b.stdout, b"b\n")
+        self.assertIn("a\n", stdout.getvalue())
+
+    def test_failed(self):
+        with patch.object(sys, "stdout", io.StringIO()) as stdout, self.assertRaises(subprocess.CalledProcessError) as ctx:
+            asyncio.run(ashell(["bash", "-c", "cat; exit 2"], input=b"data", tail=1))
+        self.assertEqual(ctx.exception.output, "data")
+        self.assertTrue(stdout.getvalue().endswith("data"))
+
+    @patch.object(sys.modules["pipeline_dsl.shell"], "THREADED_CHILD_WATCHER", False)
+    def test_thread_fallback(self):
+        async def run():
+            return await asyncio.gather(ashell(["bash", "-c", "sleep 0.5; echo a"], tail=1), ashell(["bash", "-c", "sleep 0.5; echo b"], capture_output=True))
+
+        results = []
+        start = time.monotonic()
+        with patch.object(sys, "stdout", io.StringIO()), patch("asyncio.create_subprocess_exec") as create_subprocess_exec:
+            thread = threading.Thread(target=lambda: results.extend(asyncio.run(run())))
+            thread.start()
+            thread.join()
+        self.assertLess(time.monotonic() - start, 0.9)
+        create_subprocess_exec.assert_not_called()
+        self.assertEqual([results[0].stdout, results[1].stdout], ["a\n", b"b\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
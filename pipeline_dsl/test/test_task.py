@@ -1,8 +1,24 @@
-from pipeline_dsl import Task
+from pipeline_dsl import Task, shell, stats
+from pipeline_dsl.concourse.memo import TaskMemo
+from pipeline_dsl.concourse.caches import LocalCaches, cache_path
+from pipeline_dsl.concourse.__shared import CACHE_DIR
+from pipeline_dsl.test import isolate_cache
+from mock import patch
+import io
+import json
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import time
 import unittest
 
 
 class TestJobSimple(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
     def test_basic(self):
         def test_task(out):
             return 0
@@ -23,3 +39,308 @@ class TestJobSimple(unittest.TestCase):
 
         self.assertEqual(obj["task"], "test-task")
         self.assertEqual(obj["config"]["outputs"][1], {"name": "out"})
+
+
+class TestTaskResult(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.join(CACHE_DIR, "result-job"), ignore_errors=True)
+
+    def test_pickle(self):
+        calls = []
+
+        def binary_task():
+            calls.append(1)
+            return {"data": b"\xff" * 100, "pair": (1, 2)}
+
+        task = Task(binary_task, jobname="result-job", secret_manager=None, image_resource={}, script="", result_codec="pickle")
+        with patch.object(sys, "stdout", io.StringIO()):
+            self.assertEqual(task.fn(), {"data": b"\xff" * 100, "pair": (1, 2)})
+            self.assertEqual(task.fn_cached(), {"data": b"\xff" * 100, "pair": (1, 2)})
+        self.assertEqual(calls, [1])
+        self.assertTrue(os.path.exists(os.path.join(CACHE_DIR, "result-job", "binary-task.pickle")))
+
+
+class TestTaskStats(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.join(CACHE_DIR, "stats-job"), ignore_errors=True)
+
+    def stats(self, name):
+        with open(os.path.join(CACHE_DIR, "stats-job", name + ".stats.json")) as f:
+            return json.load(f)
+
+    def test_stats(self):
+        def stats_task():
+            shell(["true"])
+            shell(["sh", "-c", "exit 0"])
+            sum(range(100000))
+
+        with patch.object(sys, "stdout", io.StringIO()):
+            Task(stats_task, jobname="stats-job", secret_manager=None, image_resource={}, script="").fn()
+        record = self.stats("stats-task")
+        self.assertEqual(record["status"], "ok")
+        self.assertEqual(record["subprocesses"], 2)
+        self.assertGreater(record["wall_seconds"], 0)
+        self.assertGreater(record["cpu_seconds"], 0)
+        self.assertNotIn("max_rss_kb", record)
+        self.assertEqual(stats.summary([record])[0].split(), ["job", "task", "status", "wall", "cpu", "children", "cpu", "subprocesses", "attempts"])
+        self.assertRegex(stats.peak_rss(), r"^Peak RSS: [1-9]\d*MiB \(pipeline\)$")
+
+    def test_shadowed_resource(self):
+        # pipeline definitions are started from their directory, which may contain a resource.py
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "resource.py"), "w") as f:
+                f.write('raise Exception("stdlib resource module shadowed")\n')
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+            subprocess.run([sys.executable, "-c", "import pipeline_dsl"], cwd=tmp, env=env, check=True, capture_output=True)
+
+    def test_failed(self):
+        def failing_task():
+            raise Exception("failed")
+
+        with patch.object(sys, "stdout", io.StringIO()), self.assertRaises(Exception):
+            Task(failing_task, jobname="stats-job", secret_manager=None, image_resource={}, script="").fn()
+        self.assertEqual(self.stats("failing-task")["status"], "failed")
+
+
+class TestTaskPaths(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.join(CACHE_DIR, "paths-job"), ignore_errors=True)
+
+    def task(self, changes):
+        self.calls = []
+
+        def paths_task():
+            self.calls.append("paths-task")
+            return "done"
+
+        return Task(paths_task, jobname="paths-job", secret_manager=None, image_resource={}, script="", paths=["src/a"], ignore_paths=["**/*.md"], changed_files=lambda: changes)
+
+    def test_skip(self):
+        with patch.object(sys, "stdout", io.StringIO()) as stdout:
+            self.assertIsNone(self.task(iter(["src/a/README.md", "src/b/main.go"])).fn())
+        self.assertEqual(self.calls, [])
+        self.assertIn("Skipping paths-task", stdout.getvalue())
+
+    def test_run(self):
+        with patch.object(sys, "stdout", io.StringIO()):
+            self.assertEqual(self.task(iter(["src/a/main.go"])).fn(), "done")
+            self.assertEqual(self.calls, ["paths-task"])
+            # changes are unknown when running locally
+            self.assertEqual(self.task(None).fn(), "done")
+            self.assertEqual(self.calls, ["paths-task"])
+
+
+@patch.object(sys.modules["pipeline_dsl.concourse.task"], "RETRY_BACKOFF", 0.01)
+class TestTaskAttempts(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.join(CACHE_DIR, "attempts-job"), ignore_errors=True)
+        shutil.rmtree(os.path.join("/tmp", "outputs", "attempts-job"), ignore_errors=True)
+
+    def task(self, failures, **kwargs):
+        self.calls = 0
+
+        def flaky_task(out):
+            self.calls += 1
+            self.assertEqual(os.listdir(out), [])
+            open(os.path.join(out, "partial"), "w").close()
+            if self.calls <= failures:
+                raise Exception(f"failure {self.calls}")
+            return self.calls
+
+        return Task(flaky_task, jobname="attempts-job", secret_manager=None, image_resource={}, script="", outputs=["out"], **kwargs)
+
+    def attempts(self):
+        with open(os.path.join(CACHE_DIR, "attempts-job", "flaky-task.stats.json")) as f:
+            return [attempt["status"] for attempt in json.load(f)["attempts"]]
+
+    def test_retry(self):
+        with patch.object(sys, "stdout", io.StringIO()) as stdout:
+            self.assertEqual(self.task(2, attempts=3).fn(), 3)
+        self.assertEqual(self.attempts(), ["failed", "failed", "ok"])
+        self.assertIn("Attempt 1/3 of flaky-task failed after", stdout.getvalue())
+        self.assertIn("Attempt 3/3 of flaky-task succeeded after", stdout.getvalue())
+
+    def test_exhausted(self):
+        with patch.object(sys, "stdout", io.StringIO()), self.assertRaisesRegex(Exception, "failure 2"):
+            self.task(2, attempts=2).fn()
+        self.assertEqual(self.attempts(), ["failed", "failed"])
+
+    def test_timeout(self):
+        def slow_task():
+            shell(["sleep", "30"])
+
+        task = Task(slow_task, jobname="attempts-job", secret_manager=None, image_resource={}, script="", timeout="100ms", attempts=2)
+        start = time.monotonic()
+        with patch.object(sys, "stdout", io.StringIO()) as stdout, self.assertRaisesRegex(TimeoutError, "timed out after 100ms"):
+            task.fn()
+        self.assertLess(time.monotonic() - start, 20)
+        self.assertIn("Attempt 1/2 of slow-task failed after", stdout.getvalue())
+
+
+class TestLocalCaches(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.caches = LocalCaches(os.path.join(self.tmp.name, "caches"), max_bytes=1000)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        shutil.rmtree(os.path.join(CACHE_DIR, "cache-job"), ignore_errors=True)
+
+    def task(self, name, size):
+        def cache_task():
+            path = cache_path("cache/pip")
+            with open(os.path.join(path, "runs"), "a") as f:
+                f.write("x")
+            with open(os.path.join(path, "data"), "w") as f:
+                f.write("x" * size)
+            with open(os.path.join(path, "runs")) as f:
+                return f.read()
+
+        return Task(cache_task, jobname="cache-job", secret_manager=None, image_resource={}, script="", name=name, caches=["cache/pip"], local_caches=self.caches)
+
+    def test_persistent(self):
+        with patch.object(sys, "stdout", io.StringIO()):
+            self.assertEqual(self.task("a", 10).fn(), "x")
+            self.assertEqual(self.task("a", 10).fn(), "xx")
+            self.assertEqual(self.task("b", 10).fn(), "x")
+        self.assertEqual(cache_path("cache/pip"), os.path.abspath("cache/pip"))
+        self.assertEqual(sorted(os.path.relpath(dir, self.caches.directory) for dir in self.caches.usage()), ["cache-job/a/cache%2Fpip", "cache-job/b/cache%2Fpip"])
+
+    def test_evict(self):
+        with patch.object(sys, "stdout", io.StringIO()) as stdout:
+            self.task("a", 400).fn()
+            time.sleep(0.01)
+            self.task("b", 400).fn()
+            time.sleep(0.01)
+            self.task("a", 400).fn()
+            self.task("c", 400).fn()
+        self.assertEqual([os.path.relpath(dir, self.caches.directory) for dir in self.caches.usage()], ["cache-job/a/cache%2Fpip", "cache-job/c/cache%2Fpip"])
+        self.assertIn("Evicted 1 cache directories", stdout.getvalue())
+
+    def test_clear(self):
+        with patch.object(sys, "stdout", io.StringIO()):
+            self.task("a", 10).fn()
+            self.task("b", 10).fn()
+        self.caches.clear("cache-job", "a")
+        self.assertEqual(len(self.caches.usage()), 1)
+        self.caches.clear()
+        self.assertEqual(self.caches.usage(), {})
+
+
+class TestTaskMemo(unittest.TestCase):
+    def setUp(self):
+        isolate_cache(self)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.memo = TaskMemo(os.path.join(self.tmp.name, "memo"))
+        self.calls = []
+        self.versions = {"repo": "v1"}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        shutil.rmtree(os.path.join("/tmp", "outputs", "memo-job"), ignore_errors=True)
+        shutil.rmtree(os.path.join(CACHE_DIR, "memo-job"), ignore_errors=True)
+
+    def task(self, value="a", **kwargs):
+        def memo_task(out):
+            self.calls.append(value)
+            with open(os.path.join(out, "file"), "w") as f:
+                f.write(value)
+            return value
+
+        return Task(
+            memo_task,
+            jobname="memo-job",
+            secret_manager=None,
+            image_resource={},
+            script="",
+            outputs=["out"],
+            memoize=True,
+            memo=self.memo,
+            input_versions=lambda: dict(self.versions),
+            **kwargs,
+        )
+
+    def test_memoize(self):
+        self.assertEqual(self.task().fn(), "a")
+        shutil.rmtree(os.path.join("/tmp", "outputs", "memo-job"))
+        self.assertEqual(self.task().fn(), "a")
+        self.assertEqual(self.calls, ["a"])
+        with open(os.path.join("/tmp", "outputs", "memo-job", "out", "file")) as f:
+            self.assertEqual(f.read(), "a")
+
+    def test_result_codec(self):
+        self.assertEqual(self.task(result_codec="pickle").fn(), "a")
+        self.assertEqual(self.task(result_codec="pickle").fn(), "a")
+        self.assertEqual(self.calls, ["a"])
+        # the entry is read with the codec it was written with
+        self.assertEqual(self.task().fn(), "a")
+        self.assertEqual(self.calls, ["a"])
+
+    def test_key(self):
+        self.task().fn()
+        self.task("b").fn()
+        self.versions["repo"] = "v2"
+        self.task().fn()
+        self.assertEqual(self.calls, ["a", "b", "a"])
+
+    def test_invalidate(self):
+        task = self.task()
+        task.fn()
+        task.invalidate()
+        task.fn()
+        self.assertEqual(self.calls, ["a", "a"])
+
+    def test_ttl(self):
+        self.memo.ttl = 0.01
+        self.task().fn()
+        time.sleep(0.02)
+        self.task().fn()
+        self.assertEqual(self.calls, ["a", "a"])
+
+    def test_eviction(self):
+        self.memo.max_bytes = 1
+        self.task("a").fn()
+        self.task("b").fn()
+        self.task("a").fn()
+        self.assertEqual(self.calls, ["a", "b", "a"])
+        self.assertEqual(len(os.listdir(os.path.join(self.memo.directory, "memo-job", "memo-task"))), 1)
+
+    def upstream(self, value):
+        def upstream_task():
+            return value
+
+        return Task(upstream_task, jobname="memo-job", secret_manager=None, image_resource={}, script="")
+
+    def test_upstream_result(self):
+        def memo_task():
+            self.calls.append(upstream())
+            return self.calls[-1]
+
+        for value in ["a", "a", "b"]:
+            upstream = self.upstream(value).fn_cached
+            shutil.rmtree(os.path.join(CACHE_DIR, "memo-job"), ignore_errors=True)
+            Task(memo_task, jobname="memo-job", secret_manager=None, image_resource={}, script="", memoize=True, memo=self.memo).fn()
+        self.assertEqual(self.calls, ["a", "b"])
+
+    def test_unreferenced_upstream(self):
+        tasks = {"upstream": self.upstream("a").fn_cached}
+
+        def memo_task():
+            return tasks["upstream"]()
+
+        task = Task(memo_task, jobname="memo-job", secret_manager=None, image_resource={}, script="", memoize=True, memo=self.memo)
+        with self.assertRaisesRegex(Exception, "uses the result of upstream-task"):
+            task.fn()
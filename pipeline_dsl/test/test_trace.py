@@ -0,0 +1,48 @@
+import unittest
+import json
+import threading
+import tempfile
+import os
+
+from pipeline_dsl import trace
+
+
+class TestTrace(unittest.TestCase):
+    def tearDown(self):
+        trace.stop()
+
+    def test_disabled(self):
+        self.assertFalse(trace.enabled())
+        self.assertIs(trace.span("a", "task"), trace.span("b", "shell", cmd="true"))
+
+    def test_spans(self):
+        trace.start()
+        with trace.span("outer", "job"):
+            with trace.span("inner", "task", job="outer"):
+                pass
+            thread = threading.Thread(target=lambda: trace.span("other", "task").__enter__().__exit__(None, None, None), name="worker")
+            thread.start()
+            thread.join()
+        with self.assertRaises(ValueError), trace.span("failing", "task"):
+            raise ValueError("boom")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            trace.stop(path)
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+        spans = {e["name"]: e for e in events if e["ph"] == "X"}
+        self.assertEqual(list(spans), ["inner", "other", "outer", "failing"])
+        outer, inner = spans["outer"], spans["inner"]
+        self.assertLessEqual(outer["ts"], inner["ts"])
+        self.assertGreaterEqual(outer["ts"] + outer["dur"], inner["ts"] + inner["dur"])
+        self.assertEqual(inner["args"], {"job": "outer"})
+        self.assertNotEqual(spans["other"]["tid"], outer["tid"])
+        self.assertEqual(spans["failing"]["args"], {"error": "boom"})
+        threads = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+        self.assertEqual(threads[spans["other"]["tid"]], "worker")
+        self.assertFalse(trace.enabled())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import asyncio
+import io
+import os
+import sys
+import time
+import subprocess
+from mock import patch
+
+from pipeline_dsl import shell, shell_lines, ashell
+from pipeline_dsl.concourse.watchdog import Watchdog, parse_duration
+
+
+class TestParseDuration(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(parse_duration("90s"), 90)
+        self.assertEqual(parse_duration("5m"), 300)
+        self.assertEqual(parse_duration("1h30m"), 5400)
+        self.assertEqual(parse_duration("1.5h"), 5400)
+        self.assertEqual(parse_duration("2m30s500ms"), 150.5)
+        self.assertEqual(parse_duration("0"), 0)
+        self.assertAlmostEqual(parse_duration("10us"), 1e-5)
+
+    def test_invalid(self):
+        for value in ["", "5", "5d", "m", "5m 3s", "1h-30m"]:
+            with self.assertRaises(Exception, msg=value):
+                parse_duration(value)
+
+
+class TestWatchdog(unittest.TestCase):
+    def test_kill_process_tree(self):
+        start = time.monotonic()
+        with patch.object(sys, "stdout", io.StringIO()), self.assertRaises(TimeoutError) as ctx:
+            with Watchdog("slow", "200ms", grace=0.1):
+                # the grandchild keeps stdout open, the shell would wait for it if only the child was killed
+                shell(["sh", "-c", "sleep 30 & sleep 30"], capture_output=True)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(str(ctx.exception), "Task slow timed out after 200ms")
+        self.assertIsInstance(ctx.exception.__cause__, subprocess.CalledProcessError)
+
+    def test_kill_streaming(self):
+        async def run():
+            await ashell(["sh", "-c", "sleep 30 & sleep 30"], tail=10)
+
+        start = time.monotonic()
+        with patch.object(sys, "stdout", io.StringIO()), self.assertRaises(TimeoutError):
+            with Watchdog("slow", "200ms", grace=0.1):
+                for _ in shell_lines(["sh", "-c", "sleep 30 & sleep 30"]):
+                    pass
+        with patch.object(sys, "stdout", io.StringIO()), self.assertRaises(TimeoutError):
+            with Watchdog("slow", "200ms", grace=0.1):
+                asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_expired(self):
+        with patch.object(sys, "stdout", io.StringIO()), self.assertRaises(TimeoutError):
+            with Watchdog("python", "10ms"):
+                time.sleep(0.1)
+                shell(["true"])
+
+    def test_in_time(self):
+        with patch.object(sys, "stdout", io.StringIO()):
+            with Watchdog("fast", "10s") as watchdog:
+                self.assertEqual(shell(["sh", "-c", "echo -n ok"], capture_output=True).stdout, b"ok")
+        self.assertFalse(watchdog.expired)
+        self.assertEqual(watchdog.processes, set())
+
+    def test_process_group(self):
+        # Ctrl-C in the terminal is delivered to the foreground process group, subprocesses have to stay in it
+        with patch.object(sys, "stdout", io.StringIO()):
+            with Watchdog("fast", "10s"):
+                pgid = shell([sys.executable, "-c", "import os; print(os.getpgrp())"], capture_output=True).stdout
+        self.assertEqual(int(pgid), os.getpgrp())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import threading
+from contextlib import nullcontext
+
+_tracer = None
+_disabled = nullcontext()
+
+
+class Span:
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, type, value, tb):
+        end = time.perf_counter_ns()
+        if value is not None:
+            self.args["error"] = str(value) or type.__name__
+        self.tracer.add(self.name, self.cat, self.start, end, self.args)
+
+
+class Tracer:
+    """
+    Collects spans of a local run as complete events of the chrome trace event format, which can be opened with
+    chrome://tracing or https://ui.perfetto.dev. Every thread is shown as a separate track.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self.threads = {}
+
+    def span(self, name, cat, args):
+        return Span(self, name, cat, args)
+
+    def add(self, name, cat, start, end, args):
+        thread = threading.current_thread()
+        self.threads.setdefault(thread.ident, thread.name)
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": (start - self.origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = args
+        # list.append is atomic, spans of concurrent tasks don't need a lock
+        self.events.append(event)
+
+    def write(self, path):
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}} for tid, name in self.threads.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f)
+
+
+def start():
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop(path=None):
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer and path:
+        tracer.write(path)
+    return tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, cat, **args):
+    tracer = _tracer
+    if tracer is None:
+        return _disabled
+    return tracer.span(name, cat, args)
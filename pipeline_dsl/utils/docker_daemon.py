@@ -4,18 +4,141 @@ from pipeline_dsl.shell import shell
 from pipeline_dsl.concourse.task import PYTHON_DIR
 from pipeline_dsl.concourse.__shared import SCRIPT_DIR
 import os
+import time
+import atexit
+import socket
+import threading
 
 START_SCRIPT = f"{PYTHON_DIR}/pipeline_dsl/utils/start-docker.sh"
 STOP_SCRIPT = f"{PYTHON_DIR}/pipeline_dsl/utils/stop-docker.sh"
+PID_FILE = "/tmp/docker.pid"
+LOG_FILE = "/tmp/docker.log"
+
+
+def docker_socket():
+    host = os.getenv("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://") :]
+    return "/var/run/docker.sock"
+
+
+class DockerDaemon:
+    """
+    Process wide, reference counted docker daemon. The daemon is started by the first user and stopped when the last one
+    leaves, or at interpreter exit if `keep_warm` is set, so subsequent users don't pay the startup time again.
+    """
+
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout if timeout is not None else int(os.getenv("DOCKERD_TIMEOUT", "60"))
+        self.keep_warm = False
+        self.refs = 0
+        self.running = False
+        self.lock = threading.Lock()
+        self.exit_hook = False
+
+    def ping(self, timeout=1):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.settimeout(timeout)
+                s.connect(self.socket_path or docker_socket())
+                s.sendall(b"GET /_ping HTTP/1.0\r\nHost: docker\r\n\r\n")
+                response = b""
+                while True:
+                    data = s.recv(4096)
+                    if not data:
+                        break
+                    response += data
+            return response.startswith(b"HTTP/1.") and response.split(b" ", 2)[1] == b"200"
+        except OSError:
+            return False
+
+    def healthy(self):
+        return self.running and self.ping()
+
+    def health(self):
+        return {"running": self.running, "healthy": self.healthy(), "refs": self.refs, "keep_warm": self.keep_warm}
+
+    def __alive(self):
+        try:
+            with open(PID_FILE) as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError):
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def __logs(self):
+        try:
+            with open(LOG_FILE) as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def wait_ready(self):
+        deadline = time.monotonic() + self.timeout
+        delay = 0.01
+        while not self.ping():
+            if not self.__alive():
+                raise Exception("Docker daemon failed to start:\n" + self.__logs())
+            if time.monotonic() >= deadline:
+                raise Exception(f"Timed out after {self.timeout}s waiting for the docker daemon:\n" + self.__logs())
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def start(self):
+        start = time.monotonic()
+        # the readiness probe below polls the docker socket instead of `docker info` once per second
+        shell([os.path.join(SCRIPT_DIR, START_SCRIPT), "--no-await"])
+        self.running = True
+        try:
+            self.wait_ready()
+        except Exception:
+            self.stop()
+            raise
+        print(f"Docker available after {time.monotonic() - start:.1f} seconds.")
+
+    def stop(self):
+        self.running = False
+        shell([os.path.join(SCRIPT_DIR, STOP_SCRIPT)])
+
+    def acquire(self, keep_warm=False):
+        with self.lock:
+            self.keep_warm = self.keep_warm or keep_warm
+            if not self.running:
+                self.start()
+            self.refs += 1
+            if self.keep_warm and not self.exit_hook:
+                atexit.register(self.shutdown)
+                self.exit_hook = True
+
+    def release(self):
+        with self.lock:
+            self.refs -= 1
+            if self.refs == 0 and self.running and not self.keep_warm:
+                self.stop()
+
+    def shutdown(self):
+        with self.lock:
+            if self.running:
+                self.stop()
+
+
+daemon = DockerDaemon()
 
 
 @contextmanager
-def docker_daemon():
+def docker_daemon(keep_warm=False):
     if concourse_context():
-        shell([os.path.join(SCRIPT_DIR, START_SCRIPT)])
+        daemon.acquire(keep_warm)
         try:
-            yield
+            yield daemon
         finally:
-            shell([os.path.join(SCRIPT_DIR, STOP_SCRIPT)])
+            daemon.release()
     else:
-        yield
+        yield None
@@ -1,5 +1,11 @@
+import hashlib
 import yaml
 
+try:
+    from yaml import CSafeDumper as BaseDumper
+except ImportError:
+    from yaml import SafeDumper as BaseDumper
+
 
 class NoTagDumper(yaml.Dumper):
     """
@@ -12,3 +18,124 @@ class NoTagDumper(yaml.Dumper):
     def __init__(self, stream, **kwargs):
         yaml.Dumper.__init__(self, stream, **kwargs)
         self.add_multi_representer(object, self.represent_object)
+
+
+class FastNoTagDumper(BaseDumper):
+    """
+    FastNoTagDumper same as NoTagDumper but based on the safe representer and libyaml's emitter if available.
+    Shared objects are written out instead of using aliases, because anchor names are not unique across multiple dumps.
+    """
+
+    def ignore_aliases(self, data):
+        return True
+
+
+FastNoTagDumper.add_multi_representer(dict, FastNoTagDumper.represent_dict)
+FastNoTagDumper.add_multi_representer(list, FastNoTagDumper.represent_list)
+FastNoTagDumper.add_multi_representer(tuple, FastNoTagDumper.represent_list)
+FastNoTagDumper.add_multi_representer(str, FastNoTagDumper.represent_str)
+FastNoTagDumper.add_multi_representer(object, lambda dumper, object: dumper.represent_dict(vars(object)))
+
+
+class CompactDumper(FastNoTagDumper):
+    """
+    CompactDumper same as FastNoTagDumper but emits anchors and aliases for objects which occur more than once
+    """
+
+    def ignore_aliases(self, data):
+        return BaseDumper.ignore_aliases(self, data)
+
+
+class SubtreeInterner:
+    """
+    Rebuilds a document of dicts and lists bottom up and replaces equal subtrees by a single shared instance,
+    so they are written once with an anchor and referenced by aliases afterwards.
+    Subtrees smaller than `min_size` (roughly in bytes) are copied, an alias wouldn't be shorter than the subtree itself.
+    """
+
+    def __init__(self, min_size=64):
+        self.min_size = min_size
+        self.instances = {}
+        self.shared = set()
+
+    def intern(self, obj):
+        return self.__visit(obj)[0]
+
+    def __visit(self, obj):
+        # returns the rebuilt object, a hashable key identifying its content and its approximate size
+        if isinstance(obj, dict):
+            items = [(k, self.__visit(v)) for k, v in obj.items()]
+            result = dict((k, v[0]) for k, v in items)
+            key = ("dict", tuple((k, v[1]) for k, v in items))
+            size = sum(len(str(k)) + v[2] + 2 for k, v in items)
+        elif isinstance(obj, (list, tuple)):
+            items = [self.__visit(v) for v in obj]
+            result = [v[0] for v in items]
+            key = ("list", tuple(v[1] for v in items))
+            size = sum(v[2] + 2 for v in items)
+        elif obj is None or isinstance(obj, (str, bytes, bool, int, float)):
+            return obj, (type(obj), obj), len(str(obj))
+        else:
+            return self.__visit(vars(obj))
+        if size < self.min_size:
+            return result, key, size
+        instance = self.instances.setdefault(key, result)
+        if instance is not result:
+            self.shared.add(id(instance))
+        # children are interned already, the key of a shared subtree is its identity
+        return instance, ("ref", id(instance)), size
+
+
+class ByteCounter:
+    """
+    Stream which only counts the number of bytes written to it
+    """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text.encode("utf-8"))
+
+
+class YamlStreamWriter:
+    """
+    Writes a top level mapping section by section, so only a single item has to be kept in memory.
+    Sections have to be written in sorted order to match the output of yaml.dump.
+    A sha256 digest of the whole document and of every named item is recorded along the way.
+    """
+
+    def __init__(self, stream, Dumper=FastNoTagDumper):
+        self.stream = stream
+        self.Dumper = Dumper
+        self.hash = hashlib.sha256()
+        self.digests = {}
+
+    def __dump(self, obj):
+        text = yaml.dump(obj, allow_unicode=True, Dumper=self.Dumper)
+        self.__write(text)
+        return text
+
+    def __write(self, text):
+        self.stream.write(text)
+        self.hash.update(text.encode("utf-8"))
+
+    def digest(self):
+        return self.hash.hexdigest()
+
+    def mapping(self, key, value):
+        self.__dump({key: value})
+
+    def sequence(self, key, items):
+        digests = self.digests.setdefault(key, {})
+        empty = True
+        for item in items:
+            if empty:
+                self.__write(f"{key}:\n")
+                empty = False
+            text = self.__dump([item])
+            name = item.get("name") if isinstance(item, dict) else getattr(item, "name", None)
+            if name is not None:
+                digests[name] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if empty:
+            self.__dump({key: []})
@@ -1,9 +1,44 @@
 import os
+import shutil
+import threading
 from pipeline_dsl.resources.git import GitRepoResource
 from pipeline_dsl.shell import shell
 from contextlib import contextmanager
 
 
+def copy_git_repo(source, target, fast=True):
+    """
+    Copies the repository `source` to `target`. Git objects are immutable, the fast path therefore hard links `.git/objects`
+    and copies everything else with reflinks if the filesystem supports them. If it fails (e.g. no GNU cp or different
+    filesystems) the whole repository is copied. Worktrees and shared clones would refer to `source` by absolute path,
+    which doesn't exist in the container of a following put step.
+    """
+    shell(["rm", "-rf", target])
+    git_dir = os.path.join(source, ".git")
+    if fast and os.path.isdir(os.path.join(git_dir, "objects")):
+        try:
+            os.makedirs(os.path.join(target, ".git"))
+            # hard links fail across filesystems, objects are linked first to fall back before copying anything else
+            shell(["cp", "-a", "-l", os.path.join(git_dir, "objects"), os.path.join(target, ".git")])
+            entries = [os.path.join(source, name) for name in os.listdir(source) if name != ".git"]
+            git_entries = [os.path.join(git_dir, name) for name in os.listdir(git_dir) if name != "objects"]
+            if entries:
+                shell(["cp", "-a", "--reflink=auto"] + entries + [target])
+            if git_entries:
+                shell(["cp", "-a", "--reflink=auto"] + git_entries + [os.path.join(target, ".git")])
+            shutil.copystat(git_dir, os.path.join(target, ".git"))
+            shutil.copystat(source, target)
+            return
+        except Exception:
+            print("Fast copy failed, copying the whole repository")
+            shell(["rm", "-rf", target])
+    shell(["cp", "-a", source, target])
+
+
+# the working directory is shared by all threads, concurrently running jobs modify repositories one after another
+_lock = threading.RLock()
+
+
 @contextmanager
 def modify_git_repo(source_repo, target, message, cached=False):
     user_name = "unknown"
@@ -14,22 +49,22 @@ def modify_git_repo(source_repo, target, message, cached=False):
         user_email = source_repo.config.get("user.email", user_email)
     else:
         source = source_repo
-    shell(["rm", "-rf", target])
-    shell(["cp", "-a", source, target])
-    cwd = os.getcwd()
-    try:
-        os.chdir(target)
-        shell(["git", "config", "user.name", user_name])
-        shell(["git", "config", "user.email", user_email])
-        shell(["git", "reset", "--mixed", "HEAD"])  # Keep working tree untouched
-        shell(["git", "clean", "-f", "-d", "-x"])
-        yield
+    with _lock:
+        copy_git_repo(source, target)
+        cwd = os.getcwd()
         try:
-            if cached:
-                shell(["git", "diff", "--cached", "--exit-code", "--quiet"])
-            else:
-                shell(["git", "diff", "--exit-code", "--quiet"])
-        except Exception:
-            shell(["git", "commit", "-a", "-m", message])
-    finally:
-        os.chdir(cwd)
+            os.chdir(target)
+            shell(["git", "config", "user.name", user_name])
+            shell(["git", "config", "user.email", user_email])
+            shell(["git", "reset", "--mixed", "HEAD"])  # Keep working tree untouched
+            shell(["git", "clean", "-f", "-d", "-x"])
+            yield
+            try:
+                if cached:
+                    shell(["git", "diff", "--cached", "--exit-code", "--quiet"])
+                else:
+                    shell(["git", "diff", "--exit-code", "--quiet"])
+            except Exception:
+                shell(["git", "commit", "-a", "-m", message])
+        finally:
+            os.chdir(cwd)
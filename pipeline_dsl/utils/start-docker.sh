@@ -142,4 +142,7 @@ await_docker() {
 }
 
 start_docker
-await_docker
+# --no-await leaves the readiness check to the caller (see docker_daemon.py)
+if [[ "${1:-}" != "--no-await" ]]; then
+  await_docker
+fi